@@ -328,7 +328,7 @@ class fibb:
     def __init__(self,n):
         self.n = n
         
-    def __len(self):
+    def __len__(self):
         return self.n
     
     def __getitem__(self,value):
@@ -366,7 +366,7 @@ class fibb:
                 raise IndexError
             return fibb._fib(value)
         else:
-            start,stop,step = value.indicies(self.n)
+            start,stop,step = value.indices(self.n)
             rng= range(start,stop,step)
             return [fibb._fib(i) for i in rng]
             
@@ -383,3 +383,1700 @@ f = fib(10)
 list(f)
     
   
+# (fib above is the recursive version again, so this fails - we wanted fibb(10))
+
+# =============================================================================
+# Fast doubling
+# Our _fib is still recursive, so fibb(200_000)[100_000] hits the recursion limit,
+# and the lru_cache only holds 1024 values, so for large indices it just keeps
+# evicting the values it is about to need.
+# 
+# We don't need recursion at all. Using the standard sequence F(0)=0, F(1)=1:
+# 
+# F(2k)   = F(k) * (2*F(k+1) - F(k))
+# F(2k+1) = F(k)**2 + F(k+1)**2
+# 
+# So if we know the pair (F(k), F(k+1)) we can jump straight to (F(2k), F(2k+1)).
+# Walking the bits of n from the most significant one, we double at every bit and
+# step forward by one whenever the bit is set - that's O(log n) big int
+# multiplications, a simple loop, and nothing to cache.
+# 
+# Remember our sequence starts 1, 1, 2, 3, ... so our n-th element is F(n+1).
+# =============================================================================
+
+class fibb:
+    
+    def __init__(self,n):
+        self.n = n
+        
+    def __len__(self):
+        return self.n
+    
+    def __getitem__(self,value):
+        if isinstance(value, int):
+            if value <0 or value>=self.n:
+                raise IndexError
+            return fibb._fib(value)
+        else:
+            start,stop,step = value.indices(self.n)
+            rng= range(start,stop,step)
+            return [fibb._fib(i) for i in rng]
+    
+    @staticmethod
+    def _fib_pair(n):
+        # returns (F(n), F(n+1))
+        a, b = 0, 1
+        for bit in bin(n)[2:]:
+            # (F(k), F(k+1)) -> (F(2k), F(2k+1))
+            a, b = a * (2*b - a), a*a + b*b
+            if bit == '1':
+                # (F(2k), F(2k+1)) -> (F(2k+1), F(2k+2))
+                a, b = b, a + b
+        return a, b
+    
+    @staticmethod
+    def _fib(n):
+        return fibb._fib_pair(n)[1]
+
+f = fibb(10)
+list(f) #[1, 1, 2, 3, 5, 8, 13, 21, 34, 55]
+f[3:6] #[3, 5, 8]
+f[::-1] #[55, 34, 21, 13, 8, 5, 3, 2, 1, 1]
+fibb._fib(100) #573147844013817084101  - same as the recursive fib(100)
+
+f = fibb(10**7 + 1)
+f[100_000].bit_length() #69424   - no more RecursionError
+#(these are far too many digits to print - str() refuses anything over 4300 digits by default)
+
+#Let's see how it scales:
+
+from timeit import timeit
+
+timeit('fibb._fib(1_000)', globals=globals(), number=10_000) #0.0496 secs   (~5 µs per call)
+timeit('fibb._fib(100_000)', globals=globals(), number=100) #0.2768 secs    (~2.8 ms per call)
+timeit('fibb._fib(1_000_000)', globals=globals(), number=10) #1.1172 secs   (~0.11 secs per call)
+timeit('fibb._fib(10_000_000)', globals=globals(), number=1) #4.5190 secs
+#The number of steps only grows with log n - what we see growing here is the cost
+#of multiplying numbers that have millions of digits.
+
+# =============================================================================
+# Slices in a single pass
+# Our slices still call _fib once for every index in the range, so
+# f[10**6:10**6+1000] does a thousand independent fast doublings.
+# 
+# But once we have the pair (F(k), F(k+1)) for the first index, every following
+# element is just one addition away - so we only need to do the fast doubling once,
+# at the start of the slice, and then walk forward.
+# 
+# For a slice with a step s we can't walk one by one, but we can jump s at a time.
+# Stepping forward by one is multiplying the pair by the matrix [[0, 1], [1, 1]],
+# and the s-th power of that matrix is
+# 
+#   [[F(s-1), F(s)  ],
+#    [F(s),   F(s+1)]]
+# 
+# which we get from one more fast doubling. So a jump of s costs 4 multiplications,
+# no matter how big s is.
+# 
+# Negative steps produce the same elements as the positive step from the other end,
+# so we just compute them in increasing order and reverse.
+# =============================================================================
+
+class fibb:
+    
+    def __init__(self,n):
+        self.n = n
+        
+    def __len__(self):
+        return self.n
+    
+    def __getitem__(self,value):
+        if isinstance(value, int):
+            if value <0 or value>=self.n:
+                raise IndexError
+            return fibb._fib(value)
+        else:
+            start,stop,step = value.indices(self.n)
+            rng= range(start,stop,step)
+            if not rng:
+                return []
+            if step > 0:
+                return fibb._fib_range(rng[0], len(rng), step)
+            return fibb._fib_range(rng[-1], len(rng), -step)[::-1]
+    
+    @staticmethod
+    def _fib_pair(n):
+        # returns (F(n), F(n+1))
+        a, b = 0, 1
+        for bit in bin(n)[2:]:
+            # (F(k), F(k+1)) -> (F(2k), F(2k+1))
+            a, b = a * (2*b - a), a*a + b*b
+            if bit == '1':
+                # (F(2k), F(2k+1)) -> (F(2k+1), F(2k+2))
+                a, b = b, a + b
+        return a, b
+    
+    @staticmethod
+    def _fib(n):
+        return fibb._fib_pair(n)[1]
+    
+    @staticmethod
+    def _fib_range(start, count, step=1):
+        # elements start, start+step, ... (count of them) of our sequence
+        a, b = fibb._fib_pair(start + 1)
+        result = [a]
+        if step == 1:
+            for _ in range(count - 1):
+                a, b = b, a + b
+                result.append(a)
+        else:
+            s0, s1 = fibb._fib_pair(step)
+            s_1 = s1 - s0   # F(s-1)
+            for _ in range(count - 1):
+                a, b = s_1*a + s0*b, s0*a + s1*b
+                result.append(a)
+        return result
+
+f = fibb(10)
+f[:] #[1, 1, 2, 3, 5, 8, 13, 21, 34, 55]
+f[2:8:3] #[2, 8]
+f[::-1] #[55, 34, 21, 13, 8, 5, 3, 2, 1, 1]
+f[-2:1:-4] #[34, 5]
+
+f = fibb(10**6 + 1000)
+f[10**6:10**6+1000:7] == [fibb._fib(i) for i in range(10**6, 10**6+1000, 7)] #True
+
+timeit('f[10**6:10**6+1000]', globals=globals(), number=10) #1.5821 secs
+timeit('f[10**6]', globals=globals(), number=10) #0.9553 secs
+#The whole slice of 1000 elements costs the fast doubling for the first element
+#plus 999 additions (~60 µs each at this size) - before, it was 1000 fast doublings.
+
+# =============================================================================
+# Bounding the cache by size, not by count
+# lru_cache(2**10) limits how many values we keep, but not how big they are.
+# Each Fibonacci number near index 10**6 is ~87KB, so 1024 of them is already ~90MB,
+# and near 10**7 it would be close to a gigabyte.
+# 
+# So let's write our own memoizing decorator that keeps track of the total
+# sys.getsizeof of everything it holds, and evicts entries when we go over
+# the budget. Two eviction policies:
+# 
+# 'lru'  - throw away the least recently used entry (same as lru_cache)
+# 'gdsf' - Greedy Dual Size Frequency: every entry gets a priority
+#          L + hits * cost / size, where cost is how long it took to compute.
+#          We evict the lowest priority first, and L is raised to the priority of
+#          whatever we just evicted, so entries that stop being used eventually age out.
+#          Big, cheap, rarely used values go first; small expensive ones stay.
+#          (Every hit pushes the entry's new priority onto the heap and leaves the old
+#          one behind, stale - once the heap is more than twice the size of the cache
+#          it's rebuilt from the live entries, so hits alone can't make it grow.)
+# 
+# Just like lru_cache, the decorated function gets cache_info() and cache_clear().
+# =============================================================================
+
+import sys
+import heapq
+from collections import OrderedDict, namedtuple
+from functools import wraps
+from time import perf_counter
+
+CacheInfo = namedtuple('CacheInfo', 'hits misses evictions currbytes maxbytes currsize')
+
+def sized_cache(maxbytes, policy='lru'):
+    if policy not in ('lru', 'gdsf'):
+        raise ValueError(f"policy must be 'lru' or 'gdsf', not {policy!r}")
+    
+    def decorator(fn):
+        cache = OrderedDict()  # key -> [value, size, cost, hits, priority]
+        heap = []              # (priority, count, key) - may contain stale entries
+        stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'bytes': 0, 'L': 0.0, 'count': 0}
+        kwd_mark = object()
+        
+        def push(key, entry):
+            entry[4] = stats['L'] + entry[3] * entry[2] / entry[1]
+            stats['count'] += 1
+            heapq.heappush(heap, (entry[4], stats['count'], key))
+            if len(heap) > 2 * len(cache) + 64:
+                # every hit leaves a stale entry behind - drop them before they pile up
+                heap[:] = [(entry[4], count, key)
+                           for count, (key, entry) in enumerate(cache.items(), stats['count'] + 1)]
+                stats['count'] += len(heap)
+                heapq.heapify(heap)
+        
+        def evict_one():
+            if policy == 'lru':
+                key, entry = cache.popitem(last=False)
+            else:
+                while True:
+                    priority, _, key = heapq.heappop(heap)
+                    entry = cache.get(key)
+                    # skip entries that were re-prioritized or already removed
+                    if entry is not None and entry[4] == priority:
+                        break
+                del cache[key]
+                stats['L'] = priority
+            stats['bytes'] -= entry[1]
+            stats['evictions'] += 1
+        
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = args + (kwd_mark,) + tuple(sorted(kwargs.items())) if kwargs else args
+            entry = cache.get(key)
+            if entry is not None:
+                stats['hits'] += 1
+                if policy == 'lru':
+                    cache.move_to_end(key)
+                else:
+                    entry[3] += 1
+                    push(key, entry)
+                return entry[0]
+            
+            stats['misses'] += 1
+            start = perf_counter()
+            value = fn(*args, **kwargs)
+            cost = perf_counter() - start
+            size = sys.getsizeof(value)
+            if size > maxbytes or key in cache:
+                # too big to ever fit (or a recursive call already stored it)
+                return value
+            while stats['bytes'] + size > maxbytes:
+                evict_one()
+            entry = [value, size, cost, 1, 0.0]
+            cache[key] = entry
+            stats['bytes'] += size
+            if policy == 'gdsf':
+                push(key, entry)
+            return value
+        
+        def cache_info():
+            return CacheInfo(stats['hits'], stats['misses'], stats['evictions'],
+                             stats['bytes'], maxbytes, len(cache))
+        
+        def cache_clear():
+            cache.clear()
+            heap.clear()
+            stats.update(hits=0, misses=0, evictions=0, bytes=0, L=0.0)
+        
+        wrapper.cache_info = cache_info
+        wrapper.cache_clear = cache_clear
+        return wrapper
+    
+    return decorator
+
+#It is a drop-in replacement for lru_cache on our recursive fib:
+
+@sized_cache(2**20)
+def fib(n):
+    if n<2:
+        return 1
+    else: 
+        return fib(n-1)+ fib(n-2)
+
+fib(100) #573147844013817084101
+fib.cache_info()
+#CacheInfo(hits=98, misses=101, evictions=0, currbytes=3108, maxbytes=1048576, currsize=101)
+
+#and on the fibb._fib static method (it goes under @staticmethod, just like lru_cache did):
+
+class fibb:
+    
+    def __init__(self,n):
+        self.n = n
+        
+    def __len__(self):
+        return self.n
+    
+    def __getitem__(self,value):
+        if isinstance(value, int):
+            if value <0 or value>=self.n:
+                raise IndexError
+            return fibb._fib(value)
+        else:
+            start,stop,step = value.indices(self.n)
+            rng= range(start,stop,step)
+            if not rng:
+                return []
+            if step > 0:
+                return fibb._fib_range(rng[0], len(rng), step)
+            return fibb._fib_range(rng[-1], len(rng), -step)[::-1]
+    
+    @staticmethod
+    def _fib_pair(n):
+        # returns (F(n), F(n+1))
+        a, b = 0, 1
+        for bit in bin(n)[2:]:
+            # (F(k), F(k+1)) -> (F(2k), F(2k+1))
+            a, b = a * (2*b - a), a*a + b*b
+            if bit == '1':
+                # (F(2k), F(2k+1)) -> (F(2k+1), F(2k+2))
+                a, b = b, a + b
+        return a, b
+    
+    @staticmethod
+    @sized_cache(2**18, policy='gdsf')
+    def _fib(n):
+        return fibb._fib_pair(n)[1]
+    
+    @staticmethod
+    def _fib_range(start, count, step=1):
+        # elements start, start+step, ... (count of them) of our sequence
+        a, b = fibb._fib_pair(start + 1)
+        result = [a]
+        if step == 1:
+            for _ in range(count - 1):
+                a, b = b, a + b
+                result.append(a)
+        else:
+            s0, s1 = fibb._fib_pair(step)
+            s_1 = s1 - s0   # F(s-1)
+            for _ in range(count - 1):
+                a, b = s_1*a + s0*b, s0*a + s1*b
+                result.append(a)
+        return result
+
+f = fibb(10**6)
+for i in range(10):
+    f[100], f[500_000 + i]
+fibb._fib.cache_info()
+#CacheInfo(hits=9, misses=11, evictions=5, currbytes=231576, maxbytes=262144, currsize=6)
+#Each f[500_000 + i] is ~43KB, so only 5 of them fit in our 256KB budget - but the
+#small (cheap to keep) f[100] was never evicted, and the cache never went over budget.
+
+# =============================================================================
+# Keeping computed terms on disk
+# Any cache we've written so far lives in memory, so every new process starts
+# from scratch and recomputes the same big terms again.
+# 
+# An opt-in fix is to keep the terms in a pair of files:
+# 
+# <path>.dat - the values, as raw little-endian bytes, appended one after the other
+# <path>.idx - fixed size records (key, offset, length), one per value
+# 
+# Since every index record has the same size (24 bytes), we can mmap the index and
+# read it as an array, and a record is either fully there or not there yet - a reader
+# just ignores a trailing partial record.
+# 
+# Appending is done under an exclusive lock (fcntl.flock - so POSIX only), and the
+# value is written *before* its index record, so a concurrent reader that sees the
+# record can always read the value. Readers never take the lock.
+# 
+# Once the data file reaches max_bytes we simply stop persisting new terms -
+# nothing already stored is ever moved, so no reader can be pulled out from under.
+# =============================================================================
+
+import os
+import mmap
+import struct
+import fcntl
+
+class DiskMemo:
+    _record = struct.Struct('<qQQ')  # key, offset, length
+    _missing = object()
+    
+    def __init__(self, path, max_bytes=2**30):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._data_fd = os.open(path + '.dat', os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+        self._index_fd = os.open(path + '.idx', os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+        self._index = {}
+        self._index_size = 0
+        self._refresh()
+    
+    def _refresh(self):
+        # pick up records appended (by us or by other processes) since last time
+        size = os.fstat(self._index_fd).st_size
+        size -= size % self._record.size
+        if size > self._index_size:
+            with mmap.mmap(self._index_fd, size, access=mmap.ACCESS_READ) as m:
+                for key, offset, length in self._record.iter_unpack(m[self._index_size:size]):
+                    self._index[key] = (offset, length)
+            self._index_size = size
+    
+    def __len__(self):
+        self._refresh()
+        return len(self._index)
+    
+    def __contains__(self, key):
+        if key not in self._index:
+            self._refresh()
+        return key in self._index
+    
+    def get(self, key, default=None):
+        if key not in self:
+            return default
+        offset, length = self._index[key]
+        return int.from_bytes(os.pread(self._data_fd, length, offset), 'little', signed=True)
+    
+    def put(self, key, value):
+        data = memoryview(value.to_bytes((value.bit_length() + 8) // 8, 'little', signed=True))
+        length = len(data)
+        fcntl.flock(self._index_fd, fcntl.LOCK_EX)
+        try:
+            self._refresh()
+            offset = os.fstat(self._data_fd).st_size
+            if key in self._index or offset + length > self.max_bytes:
+                return
+            while data:
+                data = data[os.write(self._data_fd, data):]
+            os.write(self._index_fd, self._record.pack(key, offset, length))
+            self._index[key] = (offset, length)
+            self._index_size += self._record.size
+        finally:
+            fcntl.flock(self._index_fd, fcntl.LOCK_UN)
+    
+    def __call__(self, fn):
+        # use the store as a decorator for functions of a single int argument
+        @wraps(fn)
+        def wrapper(n):
+            value = self.get(n, self._missing)
+            if value is self._missing:
+                value = fn(n)
+                self.put(n, value)
+            return value
+        wrapper.store = self
+        return wrapper
+    
+    def close(self):
+        os.close(self._data_fd)
+        os.close(self._index_fd)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.close()
+
+import math
+import tempfile
+
+store_dir = tempfile.mkdtemp()
+fib_store = DiskMemo(os.path.join(store_dir, 'fib'))
+
+class fibb:
+    
+    def __init__(self,n):
+        self.n = n
+        
+    def __len__(self):
+        return self.n
+    
+    def __getitem__(self,value):
+        if isinstance(value, int):
+            if value <0 or value>=self.n:
+                raise IndexError
+            return fibb._fib(value)
+        else:
+            start,stop,step = value.indices(self.n)
+            rng= range(start,stop,step)
+            if not rng:
+                return []
+            if step > 0:
+                return fibb._fib_range(rng[0], len(rng), step)
+            return fibb._fib_range(rng[-1], len(rng), -step)[::-1]
+    
+    @staticmethod
+    def _fib_pair(n):
+        # returns (F(n), F(n+1))
+        a, b = 0, 1
+        for bit in bin(n)[2:]:
+            # (F(k), F(k+1)) -> (F(2k), F(2k+1))
+            a, b = a * (2*b - a), a*a + b*b
+            if bit == '1':
+                # (F(2k), F(2k+1)) -> (F(2k+1), F(2k+2))
+                a, b = b, a + b
+        return a, b
+    
+    @staticmethod
+    @fib_store
+    def _fib(n):
+        return fibb._fib_pair(n)[1]
+    
+    @staticmethod
+    def _fib_range(start, count, step=1):
+        # elements start, start+step, ... (count of them) of our sequence
+        a, b = fibb._fib_pair(start + 1)
+        result = [a]
+        if step == 1:
+            for _ in range(count - 1):
+                a, b = b, a + b
+                result.append(a)
+        else:
+            s0, s1 = fibb._fib_pair(step)
+            s_1 = s1 - s0   # F(s-1)
+            for _ in range(count - 1):
+                a, b = s_1*a + s0*b, s0*a + s1*b
+                result.append(a)
+        return result
+
+#The same store works for math.factorial - in the Factorials iterable (lazy evaluation
+#lecture) we would just call factorial(self.i) instead of math.factorial(self.i):
+
+fact_store = DiskMemo(os.path.join(store_dir, 'fact'))
+factorial = fact_store(math.factorial)
+
+f = fibb(10**7)
+f[5_000_000].bit_length() #3471210
+factorial(50_000).bit_length() #708357
+len(fib_store), len(fact_store) #(1, 1)
+
+#Now pretend we restarted - new store objects just read the index back in:
+
+fib_store.close()
+fact_store.close()
+fib_store = DiskMemo(os.path.join(store_dir, 'fib'))
+fact_store = DiskMemo(os.path.join(store_dir, 'fact'))
+fib_store.get(5_000_000) == fibb._fib_pair(5_000_000)[1] #True
+fact_store.get(50_000) == math.factorial(50_000) #True
+
+timeit('fibb._fib_pair(5_000_000)', globals=globals(), number=1) #1.0567 secs
+timeit('fib_store.get(5_000_000)', globals=globals(), number=1) #0.0009 secs
+
+# =============================================================================
+# Any linear recurrence
+# Fibonacci is just one linear recurrence - Tribonacci, Lucas, Pell, ... are all of
+# the form
+# 
+#   a(i) = c1*a(i-1) + c2*a(i-2) + ... + ck*a(i-k)
+# 
+# with the first k values (the seeds) given. So instead of writing yet another
+# class by hand for each one, let's write one sequence type that takes the
+# coefficients (c1, ..., ck) and the seeds (a(0), ..., a(k-1)).
+# 
+# For random access we use Kitamasa's method: in the recurrence, x**k can always be
+# replaced by c1*x**(k-1) + ... + ck, so x**n reduces to a polynomial of degree < k
+# 
+#   x**n = r0 + r1*x + ... + r(k-1)*x**(k-1)      (mod the characteristic polynomial)
+# 
+# and then a(n) = r0*a(0) + r1*a(1) + ... + r(k-1)*a(k-1).
+# We get x**n by repeated squaring, and each multiplication of two of these
+# polynomials costs O(k**2) - so O(k**2 log n) in total.
+# 
+# Slices work like they did for fibb: one Kitamasa at the start of the slice and then
+# just run the recurrence forward, or for a step s, keep multiplying by x**s.
+# =============================================================================
+
+class LinearRecurrence:
+    
+    def __init__(self, coeffs, seeds, n):
+        if not coeffs or len(coeffs) != len(seeds):
+            raise ValueError('Need the same (non-zero) number of coefficients and seeds.')
+        self.coeffs = tuple(coeffs)
+        self.seeds = tuple(seeds)
+        self.n = n
+    
+    def __len__(self):
+        return self.n
+    
+    def __getitem__(self, value):
+        if isinstance(value, int):
+            if value < 0:
+                value = self.n + value
+            if value < 0 or value >= self.n:
+                raise IndexError
+            return self._term(value)
+        else:
+            start, stop, step = value.indices(self.n)
+            rng = range(start, stop, step)
+            if not rng:
+                return []
+            if step > 0:
+                return self._range(rng[0], len(rng), step)
+            return self._range(rng[-1], len(rng), -step)[::-1]
+    
+    def _mulmod(self, p, q):
+        # p * q, reduced using x**k = c1*x**(k-1) + ... + ck
+        k = len(self.coeffs)
+        prod = [0] * (2*k - 1)
+        for i, p_i in enumerate(p):
+            if p_i:
+                for j, q_j in enumerate(q):
+                    prod[i + j] += p_i * q_j
+        for d in range(2*k - 2, k - 1, -1):
+            t = prod[d]
+            if t:
+                for j, c in enumerate(self.coeffs, 1):
+                    prod[d - j] += t * c
+        return prod[:k]
+    
+    def _xpow(self, n):
+        # x**n reduced to degree < k
+        k = len(self.coeffs)
+        result = [1] + [0] * (k - 1)
+        base = [self.coeffs[0]] if k == 1 else [0, 1] + [0] * (k - 2)
+        while n:
+            if n & 1:
+                result = self._mulmod(result, base)
+            base = self._mulmod(base, base)
+            n >>= 1
+        return result
+    
+    def _dot(self, p):
+        return sum(r * a for r, a in zip(p, self.seeds))
+    
+    def _term(self, n):
+        if n < len(self.seeds):
+            return self.seeds[n]
+        return self._dot(self._xpow(n))
+    
+    def _range(self, start, count, step=1):
+        k = len(self.coeffs)
+        p = self._xpow(start)
+        if step == 1:
+            # k consecutive terms to get the recurrence going...
+            shift = self._xpow(1)
+            window = []
+            for _ in range(min(k, count)):
+                window.append(self._dot(p))
+                p = self._mulmod(p, shift)
+            # ...and from there on, just the recurrence itself
+            result = window[:]
+            rev_coeffs = self.coeffs[::-1]
+            for _ in range(count - len(result)):
+                term = sum(c * a for c, a in zip(rev_coeffs, window))
+                window = window[1:] + [term]
+                result.append(term)
+            return result
+        jump = self._xpow(step)
+        result = []
+        for _ in range(count):
+            result.append(self._dot(p))
+            p = self._mulmod(p, jump)
+        return result
+
+fib_seq = LinearRecurrence((1, 1), (1, 1), 10)       #same as fibb(10)
+list(fib_seq) #[1, 1, 2, 3, 5, 8, 13, 21, 34, 55]
+fib_seq[-1], fib_seq[2:8:3] #(55, [2, 8])
+
+tribonacci = LinearRecurrence((1, 1, 1), (0, 0, 1), 12)
+tribonacci[:] #[0, 0, 1, 1, 2, 4, 7, 13, 24, 44, 81, 149]
+
+lucas = LinearRecurrence((1, 1), (2, 1), 10)
+lucas[::-1] #[76, 47, 29, 18, 11, 7, 4, 3, 1, 2]
+
+pell = LinearRecurrence((2, 1), (0, 1), 10)
+pell[1::2] #[1, 5, 29, 169, 985]
+
+#and the big indices are no problem:
+LinearRecurrence((1, 1), (1, 1), 10**6)[10**5] == fibb._fib(10**5) #True
+big_tribonacci = LinearRecurrence((1, 1, 1), (0, 0, 1), 10**6)
+timeit('big_tribonacci[10**5]', globals=globals(), number=10) #0.3007 secs
+
+# =============================================================================
+# Fibonacci numbers modulo m
+# Quite often we don't want the Fibonacci number itself, only its remainder modulo
+# some m (a prime, a power of two, ...). Computing a number with millions of digits
+# just to throw almost all of it away is a waste - since (a + b) % m and (a * b) % m
+# only depend on a % m and b % m, we can reduce after every single operation in the
+# fast doubling and in the slice loops, and the numbers never grow bigger than m**2.
+# 
+# Even better, modulo m the sequence is periodic - the period is called the Pisano
+# period pi(m). So F(n) % m == F(n % pi(m)) % m, and any index maps to a small one.
+# 
+# Finding pi(m) by walking the sequence until we see 0, 1 again takes up to 6*m steps,
+# which is too slow for something like m = 10**9 + 7. But we know a lot about it:
+# 
+# pi(2) = 3, pi(5) = 20
+# for any other prime p, pi(p) divides p - 1 if p % 5 is 1 or 4, and 2*(p + 1) otherwise
+# pi(p**e) divides p**(e-1) * pi(p)
+# pi(m) is the lcm of pi(p**e) over the prime powers in m
+# 
+# That gives us a multiple L of the period, and then we just keep dividing L by its
+# prime factors for as long as F(L) % m, F(L+1) % m is still 0, 1.
+# 
+# The factoring (trial division for small primes, Pollard's rho for the rest) only
+# happens the first time the period is needed. For m above 64 bits even that can take
+# too long, so there we skip the reduction - the fast doubling is O(log n) on numbers
+# below m**2 anyway, the reduction only saves a few steps.
+# 
+# Slices modulo m come back as an array of unsigned 64 bit integers (when m fits)
+# rather than a list of int objects - 8 bytes per element instead of ~28 + 8.
+# =============================================================================
+
+from array import array
+
+class fibb:
+    
+    def __init__(self, n, mod=None):
+        if mod is not None and (not isinstance(mod, int) or mod < 1):
+            raise ValueError('mod must be None or an int >= 1')
+        self.n = n
+        self.mod = mod
+        
+    def __len__(self):
+        return self.n
+    
+    @property
+    def _period(self):
+        # the Pisano period, worked out on first use (None if mod is too big to factor quickly)
+        return None if self.mod is None else fibb._pisano(self.mod)
+    
+    def _reduce(self, k):
+        # reduce an index by the period - if we know it
+        period = self._period
+        return k if period is None else k % period
+    
+    def __getitem__(self,value):
+        if isinstance(value, int):
+            if value <0 or value>=self.n:
+                raise IndexError
+            if self.mod is None:
+                return fibb._fib(value)
+            return fibb._fib_pair(self._reduce(value + 1), self.mod)[0]
+        else:
+            start,stop,step = value.indices(self.n)
+            rng= range(start,stop,step)
+            if step > 0:
+                first, reverse = (rng[0] if rng else 0), False
+            else:
+                first, reverse, step = (rng[-1] if rng else 0), True, -step
+            if self.mod is None:
+                result = fibb._fib_range(first, len(rng), step) if rng else []
+            else:
+                result = fibb._fib_range(self._reduce(first + 1) - 1, len(rng),
+                                         self._reduce(step), self.mod) if rng else []
+                result = array('Q', result) if self.mod <= 2**64 else result
+            return result[::-1] if reverse else result
+    
+    @staticmethod
+    def _fib_pair(n, mod=None):
+        # returns (F(n), F(n+1)), reduced modulo mod if one is given
+        a, b = 0, 1
+        for bit in bin(n)[2:]:
+            # (F(k), F(k+1)) -> (F(2k), F(2k+1))
+            a, b = a * (2*b - a), a*a + b*b
+            if bit == '1':
+                # (F(2k), F(2k+1)) -> (F(2k+1), F(2k+2))
+                a, b = b, a + b
+            if mod is not None:
+                a, b = a % mod, b % mod
+        return a, b
+    
+    @staticmethod
+    def _fib(n):
+        return fibb._fib_pair(n)[1]
+    
+    @staticmethod
+    def _fib_range(start, count, step=1, mod=None):
+        # elements start, start+step, ... (count of them) of our sequence
+        a, b = fibb._fib_pair(start + 1, mod)
+        result = [a]
+        if step == 1:
+            for _ in range(count - 1):
+                a, b = b, a + b
+                if mod is not None:
+                    b %= mod
+                result.append(a)
+        else:
+            s0, s1 = fibb._fib_pair(step, mod)
+            s_1 = s1 - s0   # F(s-1)
+            for _ in range(count - 1):
+                a, b = s_1*a + s0*b, s0*a + s1*b
+                if mod is not None:
+                    a, b = a % mod, b % mod
+                result.append(a)
+        return result
+    
+    @staticmethod
+    def _prime_factors(n):
+        # {p: e} - trial division for the small factors, Pollard's rho for the rest
+        factors = {}
+        for p in range(2, 1000):
+            while n % p == 0:
+                factors[p] = factors.get(p, 0) + 1
+                n //= p
+        left = [n] if n > 1 else []
+        while left:
+            n = left.pop()
+            if fibb._is_prime(n):
+                factors[n] = factors.get(n, 0) + 1
+            else:
+                d = fibb._rho(n)
+                left += [d, n // d]
+        return factors
+    
+    @staticmethod
+    def _is_prime(n):
+        # Miller-Rabin - with these bases the answer is exact for n < 3 * 10**24
+        bases = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41)
+        if n < 2 or any(n % p == 0 for p in bases):
+            return n in bases
+        d, s = n - 1, 0
+        while d % 2 == 0:
+            d, s = d // 2, s + 1
+        for a in bases:
+            x = pow(a, d, n)
+            if x == 1 or x == n - 1:
+                continue
+            for _ in range(s - 1):
+                x = x * x % n
+                if x == n - 1:
+                    break
+            else:
+                return False
+        return True
+    
+    @staticmethod
+    def _rho(n):
+        # Pollard's rho - some factor of the composite n, other than 1 and n
+        for c in range(1, n):
+            x = y = 2
+            d = 1
+            while d == 1:
+                x = (x*x + c) % n
+                y = (y*y + c) % n
+                y = (y*y + c) % n
+                d = math.gcd(x - y, n)
+            if d != n:
+                return d
+    
+    @staticmethod
+    @lru_cache(2**10)
+    def _pisano(m):
+        if m == 1:
+            return 1
+        if m.bit_length() > 64:
+            # factoring m (and the period bound) could take forever - and the fast
+            # doubling is O(log n) on numbers below m**2 anyway, so reducing the index
+            # first doesn't buy us much. We just do without.
+            return None
+        period = 1
+        for p, e in fibb._prime_factors(m).items():
+            if p == 2:
+                pi_p = 3
+            elif p == 5:
+                pi_p = 20
+            elif p % 5 in (1, 4):
+                pi_p = p - 1
+            else:
+                pi_p = 2 * (p + 1)
+            pi_pe = p**(e - 1) * pi_p
+            period = period * pi_pe // math.gcd(period, pi_pe)
+        # period is a multiple of pi(m) - now shrink it to the smallest one
+        for q in fibb._prime_factors(period):
+            while period % q == 0 and fibb._fib_pair(period // q, m) == (0, 1):
+                period //= q
+        return period
+
+fibb._pisano(10) #60
+fibb._pisano(2**32) #6442450944  (= 3 * 2**31)
+fibb._pisano(10**9 + 7) #2000000016
+fibb._pisano(2**61 - 1) #256204778801521550  - under a millisecond with Pollard rho
+fibb._pisano(2**89 - 1) #None - too big to bother
+
+f = fibb(10**18, mod=10**9 + 7)
+f[10**17] #445100786  - instantly, the index is reduced to (10**17 + 1) % 2000000016 first
+f[:10] #array('Q', [1, 1, 2, 3, 5, 8, 13, 21, 34, 55])
+f[10**17:10**17 + 3] #array('Q', [445100786, 914957874, 360058653])
+fibb(10, mod=0) #ValueError: mod must be None or an int >= 1
+
+f = fibb(100, mod=2**8)
+f[99] == fibb._fib(99) % 2**8 #True
+f[90:70:-7].tolist() == [fibb._fib(i) % 2**8 for i in range(90, 70, -7)] #True
+
+timeit('f[10**17]', setup='f = fibb(10**18, mod=10**9 + 7)', globals=globals(), number=10_000) #0.0692 secs   (~7 µs per lookup)
+
+# =============================================================================
+# Iterating fibb
+# fibb has no __iter__, so list(f) or a for loop falls back to calling
+# __getitem__(0), __getitem__(1), ... until it gets an IndexError - an isinstance
+# check, a bounds check and a fast doubling (or cache lookup) for every element.
+# 
+# But iterating is the one case where we know exactly what comes next: just keep
+# the last two values around and add them. So let's give fibb a proper iterator
+# (same pattern as Cities / CityIterator) that does one addition per element, and
+# can start anywhere - one fast doubling to get there, then additions from there on.
+# 
+# The iterator also implements __length_hint__, which list() and friends use to
+# size the result up front.
+# =============================================================================
+
+class fibb:
+    
+    def __init__(self, n, mod=None):
+        if mod is not None and (not isinstance(mod, int) or mod < 1):
+            raise ValueError('mod must be None or an int >= 1')
+        self.n = n
+        self.mod = mod
+        
+    def __len__(self):
+        return self.n
+    
+    @property
+    def _period(self):
+        # the Pisano period, worked out on first use (None if mod is too big to factor quickly)
+        return None if self.mod is None else fibb._pisano(self.mod)
+    
+    def _reduce(self, k):
+        # reduce an index by the period - if we know it
+        period = self._period
+        return k if period is None else k % period
+    
+    def __getitem__(self,value):
+        if isinstance(value, int):
+            if value <0 or value>=self.n:
+                raise IndexError
+            if self.mod is None:
+                return fibb._fib(value)
+            return fibb._fib_pair(self._reduce(value + 1), self.mod)[0]
+        else:
+            start,stop,step = value.indices(self.n)
+            rng= range(start,stop,step)
+            if step > 0:
+                first, reverse = (rng[0] if rng else 0), False
+            else:
+                first, reverse, step = (rng[-1] if rng else 0), True, -step
+            if self.mod is None:
+                result = fibb._fib_range(first, len(rng), step) if rng else []
+            else:
+                result = fibb._fib_range(self._reduce(first + 1) - 1, len(rng),
+                                         self._reduce(step), self.mod) if rng else []
+                result = array('Q', result) if self.mod <= 2**64 else result
+            return result[::-1] if reverse else result
+    
+    def __iter__(self):
+        return self.FibIter(self)
+    
+    def iter_from(self, start):
+        if start < 0:
+            raise ValueError('start must not be negative')
+        return self.FibIter(self, start)
+    
+    class FibIter:
+        def __init__(self, fib_obj, start=0):
+            self._mod = fib_obj.mod
+            self._remaining = max(fib_obj.n - start, 0)
+            # one fast doubling to get to the starting point, then just additions
+            index = fib_obj._reduce(start + 1)
+            self._a, self._b = fibb._fib_pair(index, fib_obj.mod)
+        
+        def __iter__(self):
+            return self
+        
+        def __next__(self):
+            if self._remaining <= 0:
+                raise StopIteration
+            result = self._a
+            if self._mod is None:
+                self._a, self._b = self._b, self._a + self._b
+            else:
+                self._a, self._b = self._b, (self._a + self._b) % self._mod
+            self._remaining -= 1
+            return result
+        
+        def __length_hint__(self):
+            return self._remaining
+    
+    @staticmethod
+    def _fib_pair(n, mod=None):
+        # returns (F(n), F(n+1)), reduced modulo mod if one is given
+        a, b = 0, 1
+        for bit in bin(n)[2:]:
+            # (F(k), F(k+1)) -> (F(2k), F(2k+1))
+            a, b = a * (2*b - a), a*a + b*b
+            if bit == '1':
+                # (F(2k), F(2k+1)) -> (F(2k+1), F(2k+2))
+                a, b = b, a + b
+            if mod is not None:
+                a, b = a % mod, b % mod
+        return a, b
+    
+    @staticmethod
+    def _fib(n):
+        return fibb._fib_pair(n)[1]
+    
+    @staticmethod
+    def _fib_range(start, count, step=1, mod=None):
+        # elements start, start+step, ... (count of them) of our sequence
+        a, b = fibb._fib_pair(start + 1, mod)
+        result = [a]
+        if step == 1:
+            for _ in range(count - 1):
+                a, b = b, a + b
+                if mod is not None:
+                    b %= mod
+                result.append(a)
+        else:
+            s0, s1 = fibb._fib_pair(step, mod)
+            s_1 = s1 - s0   # F(s-1)
+            for _ in range(count - 1):
+                a, b = s_1*a + s0*b, s0*a + s1*b
+                if mod is not None:
+                    a, b = a % mod, b % mod
+                result.append(a)
+        return result
+    
+    @staticmethod
+    def _prime_factors(n):
+        # {p: e} - trial division for the small factors, Pollard's rho for the rest
+        factors = {}
+        for p in range(2, 1000):
+            while n % p == 0:
+                factors[p] = factors.get(p, 0) + 1
+                n //= p
+        left = [n] if n > 1 else []
+        while left:
+            n = left.pop()
+            if fibb._is_prime(n):
+                factors[n] = factors.get(n, 0) + 1
+            else:
+                d = fibb._rho(n)
+                left += [d, n // d]
+        return factors
+    
+    @staticmethod
+    def _is_prime(n):
+        # Miller-Rabin - with these bases the answer is exact for n < 3 * 10**24
+        bases = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41)
+        if n < 2 or any(n % p == 0 for p in bases):
+            return n in bases
+        d, s = n - 1, 0
+        while d % 2 == 0:
+            d, s = d // 2, s + 1
+        for a in bases:
+            x = pow(a, d, n)
+            if x == 1 or x == n - 1:
+                continue
+            for _ in range(s - 1):
+                x = x * x % n
+                if x == n - 1:
+                    break
+            else:
+                return False
+        return True
+    
+    @staticmethod
+    def _rho(n):
+        # Pollard's rho - some factor of the composite n, other than 1 and n
+        for c in range(1, n):
+            x = y = 2
+            d = 1
+            while d == 1:
+                x = (x*x + c) % n
+                y = (y*y + c) % n
+                y = (y*y + c) % n
+                d = math.gcd(x - y, n)
+            if d != n:
+                return d
+    
+    @staticmethod
+    @lru_cache(2**10)
+    def _pisano(m):
+        if m == 1:
+            return 1
+        if m.bit_length() > 64:
+            # factoring m (and the period bound) could take forever - and the fast
+            # doubling is O(log n) on numbers below m**2 anyway, so reducing the index
+            # first doesn't buy us much. We just do without.
+            return None
+        period = 1
+        for p, e in fibb._prime_factors(m).items():
+            if p == 2:
+                pi_p = 3
+            elif p == 5:
+                pi_p = 20
+            elif p % 5 in (1, 4):
+                pi_p = p - 1
+            else:
+                pi_p = 2 * (p + 1)
+            pi_pe = p**(e - 1) * pi_p
+            period = period * pi_pe // math.gcd(period, pi_pe)
+        # period is a multiple of pi(m) - now shrink it to the smallest one
+        for q in fibb._prime_factors(period):
+            while period % q == 0 and fibb._fib_pair(period // q, m) == (0, 1):
+                period //= q
+        return period
+
+
+f = fibb(10)
+list(f) #[1, 1, 2, 3, 5, 8, 13, 21, 34, 55]
+it = f.iter_from(7)
+it.__length_hint__() #3
+list(it) #[21, 34, 55]
+f.iter_from(-3) #ValueError: start must not be negative
+list(fibb(10, mod=7)) #[1, 1, 2, 3, 5, 1, 6, 0, 6, 6]
+#an iterator from way out in the sequence - islice to just take a few:
+from itertools import islice
+list(islice(fibb(10**18, mod=10**9 + 7).iter_from(10**17), 3)) #[445100786, 914957874, 360058653]
+
+f = fibb(5_000)
+timeit('[f[i] for i in range(len(f))]', globals=globals(), number=1) #0.0464 secs
+timeit('list(f)', globals=globals(), number=1) #0.0010 secs
+
+# =============================================================================
+# Membership and index
+# We get `in` and index for free from iteration, but that means computing every
+# element until we find the one we want (or run out).
+# 
+# There is a much better way: a positive integer x is a Fibonacci number exactly when
+# 5*x**2 + 4 or 5*x**2 - 4 is a perfect square - and math.isqrt tells us that without
+# any floating point trouble, even for huge x.
+# 
+# And since F(k) is the closest integer to phi**k / sqrt(5), the index is about
+# log(x * sqrt(5)) / log(phi) - we compute that, and then check it (and its
+# neighbours, in case of rounding) with one fast doubling.
+# 
+# Modulo m there is no such closed form, but the sequence repeats after one Pisano
+# period, so we never have to look past the first period (or the first n terms, if
+# that's fewer). That's still a scan, one addition per term: fine for m = 7 (period 16),
+# but m = 10**9 + 7 has a period of 2,000,000,016. So the scan is capped at max_scan
+# terms - past that, `in` and index() raise ValueError instead of running for minutes.
+#
+# Like a list, `in` and index() compare by value - 55.0 is in fibb(20), '55' is not.
+# =============================================================================
+
+class fibb:
+    
+    def __init__(self, n, mod=None):
+        if mod is not None and (not isinstance(mod, int) or mod < 1):
+            raise ValueError('mod must be None or an int >= 1')
+        self.n = n
+        self.mod = mod
+        
+    def __len__(self):
+        return self.n
+    
+    @property
+    def _period(self):
+        # the Pisano period, worked out on first use (None if mod is too big to factor quickly)
+        return None if self.mod is None else fibb._pisano(self.mod)
+    
+    def _reduce(self, k):
+        # reduce an index by the period - if we know it
+        period = self._period
+        return k if period is None else k % period
+    
+    def __getitem__(self,value):
+        if isinstance(value, int):
+            if value <0 or value>=self.n:
+                raise IndexError
+            if self.mod is None:
+                return fibb._fib(value)
+            return fibb._fib_pair(self._reduce(value + 1), self.mod)[0]
+        else:
+            start,stop,step = value.indices(self.n)
+            rng= range(start,stop,step)
+            if step > 0:
+                first, reverse = (rng[0] if rng else 0), False
+            else:
+                first, reverse, step = (rng[-1] if rng else 0), True, -step
+            if self.mod is None:
+                result = fibb._fib_range(first, len(rng), step) if rng else []
+            else:
+                result = fibb._fib_range(self._reduce(first + 1) - 1, len(rng),
+                                         self._reduce(step), self.mod) if rng else []
+                result = array('Q', result) if self.mod <= 2**64 else result
+            return result[::-1] if reverse else result
+    
+    max_scan = 10**6   # most terms `in` / index() will look at modulo m
+    
+    def __contains__(self, x):
+        x = fibb._as_int(x)
+        if x is None:
+            return False
+        if self.mod is not None:
+            return self._scan_mod(x) is not None
+        if x <= 0:
+            return False
+        # the square test is a quick rejection - but for really big x math.isqrt gets
+        # slower than just computing F(k) for the estimated k, so there we skip it
+        if x.bit_length() <= 4096 and not fibb._is_fib(x):
+            return False
+        try:
+            self.index(x)
+        except ValueError:
+            return False
+        return True
+    
+    def index(self, x):
+        x = fibb._as_int(x)
+        if x is None:
+            pass
+        elif self.mod is None and x > 0:
+            # F(k) is the closest integer to phi**k / sqrt(5)
+            k = round((math.log(x) + math.log(5) / 2) / math.log((1 + math.sqrt(5)) / 2))
+            for k in (k, k - 1, k + 1):
+                if k >= 1 and fibb._fib_pair(k)[0] == x:
+                    # our sequence is F(1), F(2), ... - and 1 shows up first at F(1)
+                    i = 0 if x == 1 else k - 1
+                    if i < self.n:
+                        return i
+                    break
+        elif self.mod is not None:
+            i = self._scan_mod(x)
+            if i is not None:
+                return i
+        raise ValueError('value is not in fibb')
+    
+    def _scan_mod(self, x):
+        # modulo m there is no closed form - but one period has every value there is
+        # (if we don't know the period, we have to look at all n terms)
+        if not 0 <= x < self.mod:
+            return None
+        period = self._period
+        terms = self.n if period is None else min(self.n, period)
+        if terms > self.max_scan:
+            raise ValueError(f'would have to scan {terms} terms mod {self.mod} '
+                             f'(more than max_scan = {self.max_scan})')
+        for i, term in enumerate(islice(self, terms)):
+            if term == x:
+                return i
+        return None
+    
+    @staticmethod
+    def _as_int(x):
+        # x as an int, if it is equal to one (55.0, True, ...) - otherwise None
+        try:
+            i = int(x)
+        except (TypeError, ValueError, OverflowError):
+            return None
+        return i if i == x else None
+    
+    @staticmethod
+    def _is_square(n):
+        return n >= 0 and math.isqrt(n) ** 2 == n
+    
+    @staticmethod
+    def _is_fib(x):
+        # x is a Fibonacci number exactly when 5x**2 + 4 or 5x**2 - 4 is a perfect square
+        return fibb._is_square(5*x*x + 4) or fibb._is_square(5*x*x - 4)
+    
+    def __iter__(self):
+        return self.FibIter(self)
+    
+    def iter_from(self, start):
+        if start < 0:
+            raise ValueError('start must not be negative')
+        return self.FibIter(self, start)
+    
+    class FibIter:
+        def __init__(self, fib_obj, start=0):
+            self._mod = fib_obj.mod
+            self._remaining = max(fib_obj.n - start, 0)
+            # one fast doubling to get to the starting point, then just additions
+            index = fib_obj._reduce(start + 1)
+            self._a, self._b = fibb._fib_pair(index, fib_obj.mod)
+        
+        def __iter__(self):
+            return self
+        
+        def __next__(self):
+            if self._remaining <= 0:
+                raise StopIteration
+            result = self._a
+            if self._mod is None:
+                self._a, self._b = self._b, self._a + self._b
+            else:
+                self._a, self._b = self._b, (self._a + self._b) % self._mod
+            self._remaining -= 1
+            return result
+        
+        def __length_hint__(self):
+            return self._remaining
+    
+    @staticmethod
+    def _fib_pair(n, mod=None):
+        # returns (F(n), F(n+1)), reduced modulo mod if one is given
+        a, b = 0, 1
+        for bit in bin(n)[2:]:
+            # (F(k), F(k+1)) -> (F(2k), F(2k+1))
+            a, b = a * (2*b - a), a*a + b*b
+            if bit == '1':
+                # (F(2k), F(2k+1)) -> (F(2k+1), F(2k+2))
+                a, b = b, a + b
+            if mod is not None:
+                a, b = a % mod, b % mod
+        return a, b
+    
+    @staticmethod
+    def _fib(n):
+        return fibb._fib_pair(n)[1]
+    
+    @staticmethod
+    def _fib_range(start, count, step=1, mod=None):
+        # elements start, start+step, ... (count of them) of our sequence
+        a, b = fibb._fib_pair(start + 1, mod)
+        result = [a]
+        if step == 1:
+            for _ in range(count - 1):
+                a, b = b, a + b
+                if mod is not None:
+                    b %= mod
+                result.append(a)
+        else:
+            s0, s1 = fibb._fib_pair(step, mod)
+            s_1 = s1 - s0   # F(s-1)
+            for _ in range(count - 1):
+                a, b = s_1*a + s0*b, s0*a + s1*b
+                if mod is not None:
+                    a, b = a % mod, b % mod
+                result.append(a)
+        return result
+    
+    @staticmethod
+    def _prime_factors(n):
+        # {p: e} - trial division for the small factors, Pollard's rho for the rest
+        factors = {}
+        for p in range(2, 1000):
+            while n % p == 0:
+                factors[p] = factors.get(p, 0) + 1
+                n //= p
+        left = [n] if n > 1 else []
+        while left:
+            n = left.pop()
+            if fibb._is_prime(n):
+                factors[n] = factors.get(n, 0) + 1
+            else:
+                d = fibb._rho(n)
+                left += [d, n // d]
+        return factors
+    
+    @staticmethod
+    def _is_prime(n):
+        # Miller-Rabin - with these bases the answer is exact for n < 3 * 10**24
+        bases = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41)
+        if n < 2 or any(n % p == 0 for p in bases):
+            return n in bases
+        d, s = n - 1, 0
+        while d % 2 == 0:
+            d, s = d // 2, s + 1
+        for a in bases:
+            x = pow(a, d, n)
+            if x == 1 or x == n - 1:
+                continue
+            for _ in range(s - 1):
+                x = x * x % n
+                if x == n - 1:
+                    break
+            else:
+                return False
+        return True
+    
+    @staticmethod
+    def _rho(n):
+        # Pollard's rho - some factor of the composite n, other than 1 and n
+        for c in range(1, n):
+            x = y = 2
+            d = 1
+            while d == 1:
+                x = (x*x + c) % n
+                y = (y*y + c) % n
+                y = (y*y + c) % n
+                d = math.gcd(x - y, n)
+            if d != n:
+                return d
+    
+    @staticmethod
+    @lru_cache(2**10)
+    def _pisano(m):
+        if m == 1:
+            return 1
+        if m.bit_length() > 64:
+            # factoring m (and the period bound) could take forever - and the fast
+            # doubling is O(log n) on numbers below m**2 anyway, so reducing the index
+            # first doesn't buy us much. We just do without.
+            return None
+        period = 1
+        for p, e in fibb._prime_factors(m).items():
+            if p == 2:
+                pi_p = 3
+            elif p == 5:
+                pi_p = 20
+            elif p % 5 in (1, 4):
+                pi_p = p - 1
+            else:
+                pi_p = 2 * (p + 1)
+            pi_pe = p**(e - 1) * pi_p
+            period = period * pi_pe // math.gcd(period, pi_pe)
+        # period is a multiple of pi(m) - now shrink it to the smallest one
+        for q in fibb._prime_factors(period):
+            while period % q == 0 and fibb._fib_pair(period // q, m) == (0, 1):
+                period //= q
+        return period
+
+f = fibb(100)
+55 in f #True
+56 in f #False
+f.index(55) #9
+f.index(1) #0
+f.index(fibb._fib(77)) #77
+f.index(fibb._fib(200)) #ValueError: value is not in fibb   (it is a Fibonacci number, just not in the first 100)
+8 in fibb(10, mod=7), 4 in fibb(10, mod=7) #(False, False)   (8 is never a value mod 7, and 4 is not among the first 10)
+fibb(100, mod=7).index(4) #11
+55.0 in f, '55' in f #(True, False)   - same as for a list
+(10**9 + 6) in fibb(10**18, mod=10**9 + 7) #ValueError: would have to scan 2000000016 terms mod 1000000007 (more than max_scan = 1000000)
+
+f = fibb(10**6)
+x = f[999_999]
+timeit('x in f', globals=globals(), number=10) #0.8354 secs
+timeit('f.index(x)', globals=globals(), number=10) #0.6090 secs
+#~0.1 secs each, against a scan that would add up a million numbers of up to 87KB each.
+
+# =============================================================================
+# Computing big ranges in parallel
+# list(fibb(n)) is now one addition per element - but for a range like 0..10**6 those
+# are additions of numbers with up to ~700,000 bits, all done one after the other on
+# a single core.
+# 
+# Since we can jump to any index with one fast doubling, the range can be cut into
+# chunks that don't depend on each other at all: each chunk gets seeded by a fast
+# doubling at its start and then runs its additions - so the chunks can be handed
+# out to a pool of worker processes.
+# 
+# We want the results back in order, as a stream:
+# - we only keep a limited number of chunks in flight (max_pending), so memory stays
+#   bounded no matter how long the range is
+# - the first chunk is yielded as soon as it's done, while the others keep working
+# 
+# One thing to watch out for: every number has to be pickled and sent back from the
+# worker, and the parent has to unpickle them one after the other - and just adding
+# two big numbers is about as cheap as copying them. So for the raw terms this is
+# *slower* than list(fibb(n)), no matter how many cores there are. It only pays off
+# when the per-term work stays in the workers:
+# - transform runs in the workers, e.g. str() - turning a number with thousands of
+#   digits into decimal is far more expensive than computing it (but the strings still
+#   have to come back)
+# - better, fib_chunks_parallel hands every chunk to a consume(chunk_start, chunk)
+#   function in the worker, and only sends back what that returns - e.g. write the
+#   chunk to a file and return the file name, or reduce it to a checksum
+# 
+# The workers have to be module level functions so they can be pickled and sent to the
+# worker processes (functools.partial is fine to fill in extra arguments). (On
+# Windows/macOS, where new processes are spawned rather than forked, the calling code
+# also needs to sit under an if __name__ == '__main__' guard.)
+# =============================================================================
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import os
+
+def _fib_chunk(start, count, mod, transform, consume=None):
+    chunk = fibb._fib_range(start, count, 1, mod)
+    if transform is not None:
+        chunk = [transform(x) for x in chunk]
+    return chunk if consume is None else consume(start, chunk)
+
+def _run_chunks(start, stop, chunk_size, workers, max_pending, *args):
+    # the results of _fib_chunk for each chunk of start..stop-1, in order
+    workers = workers or os.cpu_count()
+    max_pending = max_pending or 2 * workers
+    chunks = iter(range(start, stop, chunk_size))
+    with ProcessPoolExecutor(workers) as executor:
+        
+        def submit(chunk_start):
+            count = min(chunk_size, stop - chunk_start)
+            return executor.submit(_fib_chunk, chunk_start, count, *args)
+        
+        pending = deque(submit(chunk_start) for chunk_start in islice(chunks, max_pending))
+        while pending:
+            yield pending.popleft().result()
+            for chunk_start in islice(chunks, 1):
+                pending.append(submit(chunk_start))
+
+def fib_range_parallel(start, stop, *, mod=None, transform=None,
+                       chunk_size=10_000, workers=None, max_pending=None):
+    # yields elements start, ..., stop-1 of our Fibonacci sequence, in order
+    # (transform, if given, is applied in the workers - it has to be picklable too)
+    for chunk in _run_chunks(start, stop, chunk_size, workers, max_pending, mod, transform):
+        yield from chunk
+
+def fib_chunks_parallel(start, stop, consume, *, mod=None,
+                        chunk_size=10_000, workers=None, max_pending=None):
+    # yields consume(chunk_start, chunk) for each chunk of elements start, ..., stop-1,
+    # in order - consume runs in the workers, only what it returns comes back
+    yield from _run_chunks(start, stop, chunk_size, workers, max_pending, mod, None, consume)
+
+def _write_chunk(directory, chunk_start, chunk):
+    path = os.path.join(directory, f'fib_{chunk_start:012d}.txt')
+    with open(path, 'w') as f:
+        f.writelines(f'{x}\n' for x in chunk)
+    return path
+
+list(fib_range_parallel(0, 10, chunk_size=3)) #[1, 1, 2, 3, 5, 8, 13, 21, 34, 55]
+list(fib_range_parallel(100, 200, chunk_size=7)) == fibb(200)[100:200] #True
+
+#The raw terms - this is where it doesn't help:
+timeit('list(fibb(50_000))', globals=globals(), number=1) #0.2325 secs
+timeit('list(fib_range_parallel(0, 50_000))', globals=globals(), number=1) #0.8177 secs  - 3.5x slower, it's all pickling
+
+#Writing the first 20,000 terms out in decimal (F(20,000) has 4,180 digits):
+out_dir = tempfile.mkdtemp()
+def write_serial(directory, n):
+    with open(os.path.join(directory, 'fib.txt'), 'w') as f:
+        f.writelines(f'{x}\n' for x in fibb(n))
+
+timeit('write_serial(out_dir, 20_000)', globals=globals(), number=1) #2.3093 secs
+timeit('list(fib_chunks_parallel(0, 20_000, partial(_write_chunk, out_dir), chunk_size=1_000))',
+       globals=globals(), number=1) #2.2335 secs
+len(os.listdir(out_dir)) #21  - fib.txt, and one file per chunk
+#That was on a single core machine, so all we see is the overhead of the pool -
+#with the per-term work (str() and the writing) in the workers, and only a file name
+#coming back per chunk, k cores take it down to ~1/k.
+
+# =============================================================================
+# A base class for computed sequences
+# Looking back at silly and fibb, every one of them re-does the same things by hand:
+# the bounds check, negative indices, expanding a slice - and that's where the bugs
+# crept in: the first fibb defined __len instead of __len__ (so len() didn't work),
+# and the first slice version called value.indicies instead of value.indices
+# (both fixed above now).
+# 
+# All that is the same for any sequence whose elements are computed from their index.
+# So let's write it once, in a base class, and have subclasses supply only:
+# 
+# _term(i)                    - the element at (non-negative, in range) index i
+# _terms(start, count, step)  - optional: count elements start, start+step, ...
+#                               in one go (by default it just calls _term for each)
+# 
+# and the base class provides __len__, __getitem__ (ints, negative ints and slices),
+# __iter__ and __reversed__. Iteration pulls the elements in batches through _terms,
+# so a subclass with a fast _terms gets fast iteration for free.
+# 
+# For caching, a subclass can pass any memoizing decorator (lru_cache(...),
+# sized_cache(...)) when it is defined, and _term gets wrapped with it. If _term only
+# depends on i, make it a staticmethod - then one cache keyed by i is shared by all
+# the instances. A regular _term method can depend on the instance, so every instance
+# gets its own cache instead (keyed by i, and holding only a weak reference back to
+# the instance - caching on (self, i) would keep every instance alive forever).
+# =============================================================================
+
+import operator
+import weakref
+
+class ComputedSequence:
+    batch_size = 1024
+    
+    def __init_subclass__(cls, cache=None, **kwargs):
+        super().__init_subclass__(**kwargs)
+        term = cls.__dict__.get('_term')
+        if cache is None or term is None:
+            return
+        if isinstance(term, (staticmethod, classmethod)):
+            cls._term = type(term)(cache(term.__func__))
+        else:
+            def _term(self, i):
+                cached = self.__dict__.get('_cached_term')
+                if cached is None:
+                    ref = weakref.ref(self)
+                    cached = self._cached_term = cache(lambda i: term(ref(), i))
+                return cached(i)
+            cls._term = _term
+    
+    def __init__(self, n):
+        self.n = n
+    
+    def __len__(self):
+        return self.n
+    
+    def _term(self, i):
+        raise NotImplementedError
+    
+    def _terms(self, start, count, step=1):
+        return [self._term(start + j*step) for j in range(count)]
+    
+    def __getitem__(self, s):
+        if isinstance(s, slice):
+            start, stop, step = s.indices(self.n)
+            rng = range(start, stop, step)
+            if not rng:
+                return []
+            if step > 0:
+                return self._terms(rng[0], len(rng), step)
+            return self._terms(rng[-1], len(rng), -step)[::-1]
+        i = operator.index(s)
+        if i < 0:
+            i += self.n
+        if i < 0 or i >= self.n:
+            raise IndexError(f'{type(self).__name__} index out of range')
+        return self._term(i)
+    
+    def __iter__(self):
+        return self.SequenceIterator(self)
+    
+    def __reversed__(self):
+        return self.SequenceIterator(self, reverse=True)
+    
+    class SequenceIterator:
+        def __init__(self, seq, reverse=False):
+            self._seq = seq
+            self._reverse = reverse
+            self._next_start = 0        # how many elements we have fetched so far
+            self._batch = []
+            self._index = 0
+        
+        def __iter__(self):
+            return self
+        
+        def __next__(self):
+            if self._index >= len(self._batch):
+                self._fetch()
+            item = self._batch[self._index]
+            self._index += 1
+            return item
+        
+        def _fetch(self):
+            n = len(self._seq)
+            count = min(self._seq.batch_size, n - self._next_start)
+            if count <= 0:
+                raise StopIteration
+            if self._reverse:
+                self._batch = self._seq._terms(n - self._next_start - count, count)[::-1]
+            else:
+                self._batch = self._seq._terms(self._next_start, count)
+            self._next_start += count
+            self._index = 0
+        
+        def __length_hint__(self):
+            return len(self._seq) - self._next_start + len(self._batch) - self._index
+
+#Here's silly, done right this time:
+
+class silly(ComputedSequence):
+    def _term(self, i):
+        return 'This is a silly element'
+
+Silly = silly(3)
+len(Silly) #3
+Silly[-1] #'This is a silly element'
+Silly[0:5:2] #['This is a silly element', 'This is a silly element']
+list(Silly) #['This is a silly element', 'This is a silly element', 'This is a silly element']
+Silly[3] #IndexError: silly index out of range
+
+#And Fibonacci, reusing the fast doubling and single pass slices from fibb:
+
+class Fibonacci(ComputedSequence, cache=lru_cache(2**10)):
+    @staticmethod
+    def _term(i):
+        return fibb._fib_pair(i)[1]
+    
+    def _terms(self, start, count, step=1):
+        return fibb._fib_range(start, count, step)
+
+f = Fibonacci(10)
+f[-1], f[2:8:3], f[::-3] #(55, [2, 8], [55, 13, 3, 1])
+list(f) #[1, 1, 2, 3, 5, 8, 13, 21, 34, 55]
+list(reversed(f)) #[55, 34, 21, 13, 8, 5, 3, 2, 1, 1]
+f[3]; f[3]
+Fibonacci(20)[3]
+Fibonacci._term.cache_info() #CacheInfo(hits=2, misses=2, maxsize=1024, currsize=2)   (f[-1], and f[3] three times - shared by all instances)
+
+#A _term that depends on the instance gets a cache per instance, which goes away with it:
+
+class Shifted(ComputedSequence, cache=lru_cache(2**10)):
+    def __init__(self, n, offset):
+        super().__init__(n)
+        self.offset = offset
+    
+    def _term(self, i):
+        return self.offset + i
+
+s1, s2 = Shifted(5, 100), Shifted(5, 200)
+s1[3], s2[3], s1[3] #(103, 203, 103)
+s1._cached_term.cache_info() #CacheInfo(hits=1, misses=1, maxsize=1024, currsize=1)
+s1_ref = weakref.ref(s1)
+del s1
+s1_ref() #None
+
+f = Fibonacci(10_000)
+timeit('list(f)', globals=globals(), number=1) #0.0043 secs
+timeit('[f[i] for i in range(len(f))]', globals=globals(), number=1) #0.1432 secs
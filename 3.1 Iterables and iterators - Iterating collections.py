@@ -249,3 +249,6 @@ TypeError                                 Traceback (most recent call last)
 
 TypeError: 'Squares' object is not iterable
 '''
+
+#We'll fix this properly in the Iterators lecture - and since the i-th element is just
+#i**2, Squares ends up as a sequence there that can be iterated as often as we like.
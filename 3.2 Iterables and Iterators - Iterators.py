@@ -161,7 +161,7 @@ for item in sq:
 9
 16
 '''
-J#ust like Python's built-in next function calls our __next__ method, Python has a built-in function iter which calls the __iter__ method:
+#Just like Python's built-in next function calls our __next__ method, Python has a built-in function iter which calls the __iter__ method:
 
 sq = Squares(5)
 id(sq)
@@ -354,7 +354,7 @@ c = cities()
 for item in c:
     print(item)
    
- '''  
+'''
 __getitem__ called
 New Delhi
 __getitem__ called
@@ -363,3 +363,676 @@ __getitem__ called
 New York
 __getitem__ called
 '''
+
+# =============================================================================
+# Squares as a sequence
+# Our Squares is an iterator: it keeps its position in self.i, it can only be walked
+# through once, and the only way to get at the k-th square is to call next k times.
+# Even asking `x in sq` consumes it, one element at a time.
+# 
+# But there is nothing to remember here - the element at index i is just i**2.
+# So Squares can be a sequence (computed from the index, like fibb) and an iterable
+# that hands out a fresh iterator every time (like Cities), and then:
+# 
+# sq[i]       is O(1), and negative indices and slices work like they do for lists
+# x in sq     is O(1) too: x is a square exactly when isqrt(x)**2 == x,
+#             and it's in our sequence if its root is less than the length
+# sq.index(x) is just isqrt(x)
+# 
+# Iterating gives exactly the same elements as before - we just can't call next()
+# on the Squares object itself anymore, we call it on iter(sq).
+# =============================================================================
+
+import math
+
+class Squares:
+    def __init__(self, length):
+        self.length = length
+    
+    def __repr__(self):
+        return f'Squares({self.length})'
+    
+    def __len__(self):
+        return self.length
+    
+    def __getitem__(self, s):
+        if isinstance(s, slice):
+            return [i ** 2 for i in range(self.length)[s]]
+        if s < 0:
+            s += self.length
+        if s < 0 or s >= self.length:
+            raise IndexError('Squares index out of range')
+        return s ** 2
+    
+    def __contains__(self, x):
+        if not isinstance(x, int) or x < 0:
+            return False
+        root = math.isqrt(x)
+        return root * root == x and root < self.length
+    
+    def index(self, x):
+        if x not in self:
+            raise ValueError(f'{x!r} is not in Squares')
+        return math.isqrt(x)
+    
+    def count(self, x):
+        return 1 if x in self else 0
+    
+    def __iter__(self):
+        return self.SquaresIterator(0, self.length)
+    
+    def __reversed__(self):
+        return self.SquaresIterator(self.length - 1, -1, -1)
+    
+    class SquaresIterator:
+        def __init__(self, start, stop, step=1):
+            self.i = start
+            self.stop = stop
+            self.step = step
+        
+        def __iter__(self):
+            return self
+        
+        def __next__(self):
+            if self.i == self.stop:
+                raise StopIteration
+            else:
+                result = self.i ** 2
+                self.i += self.step
+                return result
+        
+        def __length_hint__(self):
+            return abs(self.stop - self.i)
+
+sq = Squares(5)
+list(sq) #[0, 1, 4, 9, 16]
+list(sq) #[0, 1, 4, 9, 16]    - not exhausted anymore
+sq[3], sq[-1] #(9, 16)
+sq[1:4], sq[::-2] #([1, 4, 9], [16, 4, 0])
+list(reversed(sq)) #[16, 9, 4, 1, 0]
+16 in sq, 15 in sq, 25 in sq #(True, False, False)   (25 is a square, but not among the first 5)
+sq.index(9) #3
+sorted(sq, reverse=True) #[16, 9, 4, 1, 0]
+
+sq_iter = iter(sq)
+next(sq_iter), next(sq_iter) #(0, 1)
+
+big = Squares(10**12)
+big[10**11] #10000000000000000000000
+10**22 in big, 10**22 + 1 in big #(True, False)
+big.index(10**22) #100000000000
+
+# =============================================================================
+# Sums, means and counts without iterating
+# sum(Squares(n)) still goes through all n elements - fine for 5, not so fine for
+# n = 10**9. But the elements are given by a polynomial in the index, and so is any
+# sum over them: 0 + 1 + 4 + ... + (n-1)**2 = (n-1)*n*(2n-1)/6.
+# 
+# Rather than look up a formula for every polynomial, we can use forward differences.
+# A polynomial p of degree d can be written as
+# 
+#   p(i) = D0*C(i, 0) + D1*C(i, 1) + ... + Dd*C(i, d)
+# 
+# where D0, D1, ... are the first entries of the difference table of p(0), ..., p(d),
+# and C is the binomial coefficient (math.comb). Summing C(i, k) for i from 0 to m-1
+# gives C(m, k+1) (the hockey stick identity), so
+# 
+#   p(0) + ... + p(m-1) = D0*C(m, 1) + D1*C(m, 2) + ... + Dd*C(m, d+1)
+# 
+# which is exact integer arithmetic, and only d+1 terms no matter how big m is.
+# A slice start, start+step, ... is also a polynomial in its position, so the same
+# trick sums any slice.
+# 
+# Counting the elements in a range of values is a binary search over the index
+# when the polynomial never decreases (non-negative coefficients), and for
+# Squares it's just two isqrt's.
+# 
+# Generic reducers (seq_sum, seq_mean) then use the .sum() / .mean() of whatever they
+# are given if it has them, and fall back to iterating otherwise.
+# =============================================================================
+
+from bisect import bisect_left
+import statistics
+from timeit import timeit
+
+class PolynomialSequence:
+    def __init__(self, coeffs, length):
+        # coeffs are c0, c1, ..., cd for c0 + c1*i + ... + cd*i**d
+        self.coeffs = tuple(coeffs)
+        self.length = length
+    
+    def __repr__(self):
+        return f'PolynomialSequence({self.coeffs}, {self.length})'
+    
+    def __len__(self):
+        return self.length
+    
+    def _value(self, i):
+        result = 0
+        for c in reversed(self.coeffs):
+            result = result * i + c
+        return result
+    
+    def __getitem__(self, s):
+        if isinstance(s, slice):
+            return [self._value(i) for i in range(self.length)[s]]
+        if s < 0:
+            s += self.length
+        if s < 0 or s >= self.length:
+            raise IndexError(f'{type(self).__name__} index out of range')
+        return self._value(s)
+    
+    def __iter__(self):
+        return (self._value(i) for i in range(self.length))
+    
+    @staticmethod
+    def _differences(values):
+        # first entry of every row of the difference table
+        diffs = []
+        while values:
+            diffs.append(values[0])
+            values = [b - a for a, b in zip(values, values[1:])]
+        return diffs
+    
+    def _range_sum(self, start, count, step=1):
+        points = [self._value(start + j*step) for j in range(len(self.coeffs))]
+        return sum(d * math.comb(count, k + 1) for k, d in enumerate(self._differences(points)))
+    
+    def prefix_sum(self, k):
+        # sum of the first k elements
+        return self._range_sum(0, min(k, self.length))
+    
+    def sum(self, start=None, stop=None, step=None):
+        # sum of self[start:stop:step]
+        rng = range(self.length)[start:stop:step]
+        return self._range_sum(rng[0], len(rng), rng.step) if rng else 0
+    
+    def mean(self, start=None, stop=None, step=None):
+        rng = range(self.length)[start:stop:step]
+        if not rng:
+            raise statistics.StatisticsError('mean requires at least one data point')
+        return self._range_sum(rng[0], len(rng), rng.step) / len(rng)
+    
+    def count_in_range(self, lo, hi):
+        # how many elements v with lo <= v < hi
+        if any(c < 0 for c in self.coeffs):
+            return sum(1 for v in self if lo <= v < hi)
+        indices = range(self.length)
+        return max(bisect_left(indices, hi, key=self._value)
+                   - bisect_left(indices, lo, key=self._value), 0)
+
+class Squares(PolynomialSequence):
+    def __init__(self, length):
+        super().__init__((0, 0, 1), length)
+    
+    def __repr__(self):
+        return f'Squares({self.length})'
+    
+    def _value(self, i):
+        return i ** 2
+    
+    def __contains__(self, x):
+        if not isinstance(x, int) or x < 0:
+            return False
+        root = math.isqrt(x)
+        return root * root == x and root < self.length
+    
+    def index(self, x):
+        if x not in self:
+            raise ValueError(f'{x!r} is not in Squares')
+        return math.isqrt(x)
+    
+    def count(self, x):
+        return 1 if x in self else 0
+    
+    def count_in_range(self, lo, hi):
+        # i**2 >= lo  <=>  i >= ceil(sqrt(lo));  i**2 < hi  <=>  i <= isqrt(hi - 1)
+        first = math.isqrt(lo - 1) + 1 if lo > 0 else 0
+        last = min(math.isqrt(hi - 1), self.length - 1) if hi > 0 else -1
+        return max(last - first + 1, 0)
+    
+    def __iter__(self):
+        return self.SquaresIterator(0, self.length)
+    
+    def __reversed__(self):
+        return self.SquaresIterator(self.length - 1, -1, -1)
+    
+    class SquaresIterator:
+        def __init__(self, start, stop, step=1):
+            self.i = start
+            self.stop = stop
+            self.step = step
+        
+        def __iter__(self):
+            return self
+        
+        def __next__(self):
+            if self.i == self.stop:
+                raise StopIteration
+            else:
+                result = self.i ** 2
+                self.i += self.step
+                return result
+        
+        def __length_hint__(self):
+            return abs(self.stop - self.i)
+
+def seq_sum(iterable, start=0):
+    fast_sum = getattr(iterable, 'sum', None)
+    if callable(fast_sum):
+        return start + fast_sum()
+    return sum(iterable, start)
+
+def seq_mean(iterable):
+    fast_mean = getattr(iterable, 'mean', None)
+    if callable(fast_mean):
+        return fast_mean()
+    return statistics.mean(iterable)
+
+sq = Squares(5)
+sq.sum() #30
+sum(sq) #30
+sq.sum(1, 4), sum(sq[1:4]) #(14, 14)
+sq.sum(None, None, -2), sum(sq[::-2]) #(20, 20)
+sq.prefix_sum(3) #5
+sq.mean() #6.0
+sq.count_in_range(1, 10), sq.count_in_range(2, 100) #(3, 3)   (1, 4, 9 and 4, 9, 16)
+
+huge = Squares(10**9)
+huge.sum() #333333332833333333500000000
+seq_sum(huge) #333333332833333333500000000   - instantly, no iteration
+seq_sum([0, 1, 4]) #5   - a plain list just goes through sum()
+seq_mean(huge) #3.333333328333333e+17
+huge.count_in_range(10**6, 10**12) #999000
+
+p = PolynomialSequence((1, 2, 3), 10)   # 3i**2 + 2i + 1
+list(p) #[1, 6, 17, 34, 57, 86, 121, 162, 209, 262]
+p.sum(), sum(p) #(955, 955)
+p.count_in_range(10, 100), sum(1 for v in p if 10 <= v < 100) #(4, 4)
+
+timeit('sum(Squares(10**7))', globals=globals(), number=1) #1.3155 secs
+timeit('seq_sum(Squares(10**7))', globals=globals(), number=1) #0.0001 secs
+
+# =============================================================================
+# Getting items in batches
+# Every call to next() is a Python level method call that hands back one object -
+# and when the work per element is as small as i ** 2, that call overhead is most of
+# the cost.
+# 
+# So let's give the iterator a next_batch(n) method that returns up to n items at
+# once (an empty batch means we're done). Inside it we can use a list comprehension
+# over a range, which runs at C speed compared to n separate __next__ calls.
+# If we ask for a typecode, we get a compact array back instead of a list.
+# 
+# next_batch moves the iterator forward, so we can freely mix it with next().
+# 
+# To make use of it without writing while loops everywhere:
+# iter_batches(iterable, n)  - yields batches, using next_batch if the iterator has
+#                              one, and islice otherwise (works for any iterable)
+# consume(iterable, fn, n)   - calls fn with every batch, returns how many items
+# =============================================================================
+
+from array import array
+from itertools import islice
+
+class Squares(PolynomialSequence):
+    def __init__(self, length):
+        super().__init__((0, 0, 1), length)
+    
+    def __repr__(self):
+        return f'Squares({self.length})'
+    
+    def _value(self, i):
+        return i ** 2
+    
+    def __contains__(self, x):
+        if not isinstance(x, int) or x < 0:
+            return False
+        root = math.isqrt(x)
+        return root * root == x and root < self.length
+    
+    def index(self, x):
+        if x not in self:
+            raise ValueError(f'{x!r} is not in Squares')
+        return math.isqrt(x)
+    
+    def count(self, x):
+        return 1 if x in self else 0
+    
+    def count_in_range(self, lo, hi):
+        # i**2 >= lo  <=>  i >= ceil(sqrt(lo));  i**2 < hi  <=>  i <= isqrt(hi - 1)
+        first = math.isqrt(lo - 1) + 1 if lo > 0 else 0
+        last = min(math.isqrt(hi - 1), self.length - 1) if hi > 0 else -1
+        return max(last - first + 1, 0)
+    
+    def __iter__(self):
+        return self.SquaresIterator(0, self.length)
+    
+    def __reversed__(self):
+        return self.SquaresIterator(self.length - 1, -1, -1)
+    
+    class SquaresIterator:
+        def __init__(self, start, stop, step=1):
+            self.i = start
+            self.stop = stop
+            self.step = step
+        
+        def __iter__(self):
+            return self
+        
+        def __next__(self):
+            if self.i == self.stop:
+                raise StopIteration
+            else:
+                result = self.i ** 2
+                self.i += self.step
+                return result
+        
+        def next_batch(self, n, typecode=None):
+            # up to n more squares in one go - a list, or an array if a typecode is given
+            stop = self.i + max(n, 0) * self.step
+            if (stop - self.stop) * self.step > 0:
+                stop = self.stop
+            batch = [i * i for i in range(self.i, stop, self.step)]
+            self.i = stop
+            return batch if typecode is None else array(typecode, batch)
+        
+        def __length_hint__(self):
+            return abs(self.stop - self.i)
+
+def iter_batches(iterable, n):
+    it = iter(iterable)
+    next_batch = getattr(it, 'next_batch', None)
+    while True:
+        batch = next_batch(n) if next_batch is not None else list(islice(it, n))
+        if not batch:
+            return
+        yield batch
+
+def consume(iterable, fn, n=1024):
+    count = 0
+    for batch in iter_batches(iterable, n):
+        fn(batch)
+        count += len(batch)
+    return count
+
+sq_iter = iter(Squares(10))
+next(sq_iter) #0
+sq_iter.next_batch(4) #[1, 4, 9, 16]
+sq_iter.next_batch(3, 'q') #array('q', [25, 36, 49])
+sq_iter.next_batch(100) #[64, 81]
+sq_iter.next_batch(100) #[]
+sq_iter.next_batch(-3) #[] - a negative n is treated as 0
+list(iter_batches(reversed(Squares(5)), 2)) #[[16, 9], [4, 1], [0]]
+list(iter_batches([1, 2, 3], 2)) #[[1, 2], [3]]   - a plain list works too
+
+total = 0
+def add_to_total(batch):
+    global total
+    total += sum(batch)
+consume(Squares(1000), add_to_total) #1000
+total == Squares(1000).sum() #True
+
+#A small benchmark: per-element time of a plain next() loop against next_batch(k)
+
+def benchmark_batches(make_iter, batch_sizes=(1, 16, 256, 4096), number=3):
+    # make_iter() must return a fresh iterator every time
+    n = sum(1 for _ in make_iter())
+    
+    def one_by_one():
+        for _ in make_iter():
+            pass
+    
+    results = {'next': timeit(one_by_one, number=number) / (number * n) * 1e9}
+    for k in batch_sizes:
+        def batched():
+            it = make_iter()
+            while it.next_batch(k):
+                pass
+        results[k] = timeit(batched, number=number) / (number * n) * 1e9
+    return {key: round(ns, 1) for key, ns in results.items()}   # nanoseconds per element
+
+benchmark_batches(lambda: iter(Squares(10**6)))
+#{'next': 122.1, 1: 521.4, 16: 77.3, 256: 52.2, 4096: 41.4}
+#Batches of one are slower (a method call *and* a list per item), but from a few dozen
+#items per batch on we're about 3x faster per element than calling next().
+
+# =============================================================================
+# Skipping ahead
+# itertools.islice(iter(Squares(10**12)), 10**9, None) has to call next() a billion
+# times and throw the results away before it gets to the item we want - even though
+# we know exactly what that item is.
+# 
+# So let's define a small protocol for iterators that can skip ahead cheaply:
+# 
+# seek(k)     - position the iterator so that the next item is its k-th item
+#               (counting from where the iterator started)
+# advance(k)  - skip the next k items
+# 
+# Both stop at the end of the iteration if we ask for more than there is.
+# For Squares the position is just arithmetic on i.
+# 
+# seek_islice works like itertools.islice, but if the iterator implements advance it
+# uses it to skip over the items it doesn't need - and otherwise it simply falls back
+# to itertools.islice.
+# =============================================================================
+
+class Squares(PolynomialSequence):
+    def __init__(self, length):
+        super().__init__((0, 0, 1), length)
+    
+    def __repr__(self):
+        return f'Squares({self.length})'
+    
+    def _value(self, i):
+        return i ** 2
+    
+    def __contains__(self, x):
+        if not isinstance(x, int) or x < 0:
+            return False
+        root = math.isqrt(x)
+        return root * root == x and root < self.length
+    
+    def index(self, x):
+        if x not in self:
+            raise ValueError(f'{x!r} is not in Squares')
+        return math.isqrt(x)
+    
+    def count(self, x):
+        return 1 if x in self else 0
+    
+    def count_in_range(self, lo, hi):
+        # i**2 >= lo  <=>  i >= ceil(sqrt(lo));  i**2 < hi  <=>  i <= isqrt(hi - 1)
+        first = math.isqrt(lo - 1) + 1 if lo > 0 else 0
+        last = min(math.isqrt(hi - 1), self.length - 1) if hi > 0 else -1
+        return max(last - first + 1, 0)
+    
+    def __iter__(self):
+        return self.SquaresIterator(0, self.length)
+    
+    def __reversed__(self):
+        return self.SquaresIterator(self.length - 1, -1, -1)
+    
+    class SquaresIterator:
+        def __init__(self, start, stop, step=1):
+            self.start = start
+            self.i = start
+            self.stop = stop
+            self.step = step
+        
+        def __iter__(self):
+            return self
+        
+        def __next__(self):
+            if self.i == self.stop:
+                raise StopIteration
+            else:
+                result = self.i ** 2
+                self.i += self.step
+                return result
+        
+        def next_batch(self, n, typecode=None):
+            # up to n more squares in one go - a list, or an array if a typecode is given
+            stop = self.i + max(n, 0) * self.step
+            if (stop - self.stop) * self.step > 0:
+                stop = self.stop
+            batch = [i * i for i in range(self.i, stop, self.step)]
+            self.i = stop
+            return batch if typecode is None else array(typecode, batch)
+        
+        def seek(self, k):
+            # position the iterator so that the next item is its k-th one
+            self.i = self.start + max(k, 0) * self.step
+            if (self.i - self.stop) * self.step > 0:
+                self.i = self.stop
+        
+        def advance(self, k):
+            self.seek((self.i - self.start) // self.step + k)
+        
+        def __length_hint__(self):
+            return abs(self.stop - self.i)
+
+def seek_islice(iterable, *args):
+    islice((), *args)   # the same argument checks (and errors) as islice
+    it = iter(iterable)
+    if not hasattr(it, 'advance'):
+        return islice(it, *args)
+    return _seek_islice(it, slice(*args))
+
+def _seek_islice(it, s):
+    start, stop, step = s.start or 0, s.stop, s.step or 1
+    it.advance(start)
+    position = start
+    while stop is None or position < stop:
+        try:
+            item = next(it)
+        except StopIteration:
+            return
+        yield item
+        # like islice, don't skip past stop - the iterator ends up right at stop
+        skip = step if stop is None else min(step, stop - position)
+        it.advance(skip - 1)
+        position += skip
+
+sq_iter = iter(Squares(10))
+sq_iter.advance(3)
+next(sq_iter) #9
+sq_iter.seek(8)
+next(sq_iter), next(sq_iter) #(64, 81)
+sq_iter.seek(1)
+sq_iter.next_batch(3) #[1, 4, 9]
+
+rev_iter = reversed(Squares(10))
+rev_iter.advance(2)
+next(rev_iter) #49
+rev_iter.advance(-100)
+next(rev_iter) #81 - can't go back past the start
+
+list(seek_islice(Squares(10), 2, 8, 3)) #[4, 25]
+list(seek_islice(Squares(10), 4)) #[0, 1, 4, 9]
+list(seek_islice([0, 1, 4, 9, 16], 1, None, 2)) #[1, 9]   - no advance on a list iterator, so plain islice
+sq_iter = iter(Squares(10))
+list(seek_islice(sq_iter, 0, 5, 2)), next(sq_iter) #([0, 4, 16], 25) - same as islice would leave it
+seek_islice(Squares(10), 0, 5, 0) #ValueError: Step for islice() must be a positive integer or None.
+seek_islice(Squares(10), -1, 5) #ValueError: Indices for islice() must be None or an integer: 0 <= x <= sys.maxsize.
+
+timeit('next(islice(iter(Squares(10**12)), 10**7, None))', globals=globals(), number=1) #2.2148 secs
+timeit('next(seek_islice(Squares(10**12), 10**7, None))', globals=globals(), number=1) #0.00004 secs
+next(seek_islice(Squares(10**12), 10**11, None)) #10000000000000000000000   - instantly
+
+# =============================================================================
+# Native iteration for __getitem__-only sequences
+# Our cities class above (and silly, back in the Custom Sequences lecture) only has
+# __getitem__, so Python iterates over it the legacy way: call __getitem__(0),
+# __getitem__(1), ... - a full Python method call per element - and stop when one of
+# those calls raises IndexError.
+# 
+# When we know how long the sequence is, we can do better. The native_iter class
+# decorator adds an __iter__ to classes that don't have one:
+# 
+# - if the elements are sitting in a list (or any iterable) attribute, and
+#   __getitem__(i) just returns storage[i], we name that attribute and __iter__ hands
+#   out the storage's own iterator - for a list that's the C level list_iterator.
+#   The decorator doesn't try to find the storage by itself: all it could see is the
+#   instance's attributes, not whether __getitem__ really returns storage[i] unchanged
+#   (cities above returns it as is, but a class could just as well strip, convert or
+#   filter what it stores) - so it's up to us to say which attribute it is.
+# - otherwise, if the class has __len__, __iter__ is map(self.__getitem__, range(len(self))):
+#   still one __getitem__ call per element, but the loop itself runs in C, and there's
+#   no IndexError to raise and catch at the end
+# - with neither, there's no way to know where the sequence ends other than IndexError,
+#   so the class is left alone (same if it already has an __iter__ - its own or one it
+#   inherits, e.g. from list)
+# =============================================================================
+
+from timeit import timeit
+
+def native_iter(storage=None):
+    def decorator(cls):
+        if hasattr(cls, '__iter__') or not hasattr(cls, '__getitem__'):
+            return cls
+        if storage is not None:
+            def __iter__(self):
+                return iter(getattr(self, storage))
+        elif hasattr(cls, '__len__'):
+            def __iter__(self):
+                return map(self.__getitem__, range(len(self)))
+        else:
+            return cls
+        cls.__iter__ = __iter__
+        return cls
+    return decorator
+
+#cities without the print this time, so we can time it:
+
+class cities:
+    def __init__(self, names=None):
+        self._cities = names if names is not None else ['New Delhi','New castle','New York']
+    
+    def __getitem__(self,s):
+        return self._cities[s]
+
+@native_iter('_cities')
+class fast_cities(cities):
+    pass
+
+list(fast_cities()) #['New Delhi', 'New castle', 'New York']
+type(iter(fast_cities())) #<class 'list_iterator'>
+
+#and silly, with a length but no storage:
+
+class silly:
+    def __init__(self,n):
+        self.n = n
+    
+    def __len__(self):
+        return self.n
+    
+    def __getitem__(self,value):
+        if value<0 or value >= self.n:
+            raise IndexError
+        return 'This is a silly element'
+
+@native_iter()
+class fast_silly(silly):
+    pass
+
+list(fast_silly(2)) #['This is a silly element', 'This is a silly element']
+type(iter(fast_silly(2))) #<class 'map'>
+
+#an __iter__ the class already has (or inherits) is kept:
+
+@native_iter()
+class names_list(list):
+    pass
+
+type(iter(names_list(['Paris']))) #<class 'list_iterator'>
+
+names = ['New Delhi', 'New castle', 'New York', 'Newark'] * 2_500_000   # 10 million
+timeit('for _ in cities(names): pass', globals=globals(), number=1) #1.1597 secs
+timeit('for _ in fast_cities(names): pass', globals=globals(), number=1) #0.1028 secs
+timeit('for _ in silly(10**7): pass', globals=globals(), number=1) #1.3336 secs
+timeit('for _ in fast_silly(10**7): pass', globals=globals(), number=1) #1.3328 secs
+#Going straight to the storage is >10x faster. For silly, almost all the time is spent
+#inside __getitem__ itself, so replacing the loop around it hardly matters - the
+#real win needs the storage (or a batch method, like ComputedSequence._terms).
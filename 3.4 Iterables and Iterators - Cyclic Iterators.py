@@ -39,3 +39,70 @@ iter_cycle = itertools.cycle('NSWE')
 items = [f'{i}{next(iter_cycle)}' for i in range(1,n+1)]
 print(items)#['1N', '2S', '3W', '4E', '5N', '6S', '7W', '8E', '9N', '10S']
 
+
+#Skipping ahead in cyclic
+#Since cyclic only keeps a counter, jumping ahead by k is just adding k to it - no need
+#to call next() k times. (Same seek/advance protocol as for the Squares iterator in the
+#Iterators lecture.)
+
+class cyclic:
+    def __init__(self,dir_):
+        self.dir_ = dir_
+        self.index = 0
+        
+    def __iter__(self):
+        return self
+    
+    def __next__(self):
+        res = self.dir_[self.index% len(self.dir_)]
+        self.index+=1
+        return res
+    
+    def seek(self, k):
+        self.index = max(k, 0)
+    
+    def advance(self, k):
+        self.seek(self.index + k)
+
+c = cyclic('nsew')
+c.advance(10**9 + 2)
+next(c), next(c) #('e', 'w')
+c.seek(1)
+next(c) #'s'
+
+#Checkpointing cyclic
+#To be able to save where a cyclic iterator is and pick up from there later (see the
+#CheckpointManager in the Sorting Iterables lecture), all we need is the index:
+
+class cyclic:
+    def __init__(self,dir_):
+        self.dir_ = dir_
+        self.index = 0
+        
+    def __iter__(self):
+        return self
+    
+    def __next__(self):
+        res = self.dir_[self.index% len(self.dir_)]
+        self.index+=1
+        return res
+    
+    def seek(self, k):
+        self.index = max(k, 0)
+    
+    def advance(self, k):
+        self.seek(self.index + k)
+    
+    def getstate(self):
+        return {'index': self.index}
+    
+    def setstate(self, state):
+        self.index = state['index']
+
+c = cyclic('nsew')
+next(c), next(c), next(c) #('n', 's', 'e')
+state = c.getstate()
+state #{'index': 3}
+c2 = cyclic('nsew')
+c2.setstate(state)
+next(c2) #'w'
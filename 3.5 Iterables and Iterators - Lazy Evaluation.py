@@ -73,7 +73,7 @@ We'll examine that in detail in the next section on generators
 # =============================================================================
 
 import math
-​
+
 class Circle:
     def __init__(self, r):
         self.radius = r
@@ -107,7 +107,7 @@ class Circle:
     @radius.setter
     def radius(self, r):
         self._radius = r
-​
+
     @property
     def area(self):
         return math.pi * self.radius ** 2
@@ -131,7 +131,7 @@ class Circle:
     def radius(self, r):
         self._radius = r
         self._area = None
-​
+
     @property
     def area(self):
         if self._area is None:
@@ -203,7 +203,7 @@ class Factorials:
             return result
 factorials = Factorials()
 fact_iter = iter(factorials)
-​
+
 for _ in range(10):
     print(next(fact_iter))
 # =============================================================================
@@ -219,3 +219,744 @@ for _ in range(10):
 # 362880
 # You'll notice that the main part of the iterable code is in the iterator, and the iterable itself is nothing more than a thin shell that allows us to create and access the iterator. This is so common, that there is a better way of doing this that we'll see when we deal with generators.
 # =============================================================================
+
+# =============================================================================
+# Factorials in batches
+# Two things slow our FactIter down: every __next__ call computes math.factorial(i)
+# from scratch, even though we just computed (i-1)! - and every element is a separate
+# method call.
+# 
+# The first one is easy: keep the last factorial around and multiply it by i.
+# For the second, we add a next_batch(n) method that hands back up to n factorials at
+# once. itertools.accumulate with operator.mul produces the running products for us,
+# in a loop that runs in C.
+# 
+# The length is optional again - None means the iterable is infinite.
+# =============================================================================
+
+import operator
+from itertools import accumulate
+from timeit import timeit
+
+class Factorials:
+    def __init__(self, length=None):
+        self.length = length
+    
+    def __iter__(self):
+        return self.FactIter(self.length)
+    
+    class FactIter:
+        def __init__(self, length=None):
+            self.length = length
+            self.i = 0
+            self._fact = 1   # always i!
+        
+        def __iter__(self):
+            return self
+        
+        def __next__(self):
+            if self.length is not None and self.i >= self.length:
+                raise StopIteration
+            else:
+                result = self._fact
+                self.i += 1
+                self._fact *= self.i
+                return result
+        
+        def next_batch(self, n):
+            n = max(n, 0)
+            if self.length is not None:
+                n = max(min(n, self.length - self.i), 0)
+            if n == 0:
+                return []
+            batch = list(accumulate(range(self.i + 1, self.i + n), operator.mul, initial=self._fact))
+            self.i += n
+            self._fact = batch[-1] * self.i
+            return batch
+
+fact_iter = iter(Factorials(10))
+next(fact_iter) #1
+fact_iter.next_batch(4) #[1, 2, 6, 24]
+fact_iter.next_batch(100) #[120, 720, 5040, 40320, 362880]
+fact_iter.next_batch(100) #[]
+
+fact_iter = iter(Factorials())   # infinite
+fact_iter.next_batch(3), next(fact_iter) #([1, 1, 2], 6)
+
+def batched_loop(it, n):
+    while it.next_batch(n):
+        pass
+
+timeit('for _ in Factorials(500): pass', globals=globals(), number=100) #0.0112 secs
+timeit('batched_loop(iter(Factorials(500)), 256)', globals=globals(), number=100) #0.0065 secs
+timeit('[math.factorial(i) for i in range(500)]', globals=globals(), number=100) #0.1778 secs   (the old way, for comparison)
+
+# =============================================================================
+# Skipping ahead in Factorials
+# Skipping k factorials with islice means k multiplications (and k next() calls) just
+# to throw the results away. Instead, FactIter can implement the same seek/advance
+# protocol as the Squares iterator (Iterators lecture):
+# 
+# - for a short hop forward we multiply from the factorial we already have,
+#   (i+1) * (i+2) * ... * k
+# - for anything else we let math.factorial compute k! directly - it uses a divide and
+#   conquer product in C, which is much faster than multiplying one by one
+# =============================================================================
+
+class Factorials:
+    def __init__(self, length=None):
+        self.length = length
+    
+    def __iter__(self):
+        return self.FactIter(self.length)
+    
+    class FactIter:
+        def __init__(self, length=None):
+            self.length = length
+            self.i = 0
+            self._fact = 1   # always i!
+        
+        def __iter__(self):
+            return self
+        
+        def __next__(self):
+            if self.length is not None and self.i >= self.length:
+                raise StopIteration
+            else:
+                result = self._fact
+                self.i += 1
+                self._fact *= self.i
+                return result
+        
+        def seek(self, k):
+            k = max(k, 0)
+            if self.length is not None:
+                k = min(k, self.length)
+            if self.i <= k <= self.i + 64:
+                # a short hop forward - just multiply our way there
+                self._fact *= math.prod(range(self.i + 1, k + 1))
+            else:
+                self._fact = math.factorial(k)
+            self.i = k
+        
+        def advance(self, k):
+            self.seek(self.i + k)
+        
+        def next_batch(self, n):
+            n = max(n, 0)
+            if self.length is not None:
+                n = max(min(n, self.length - self.i), 0)
+            if n == 0:
+                return []
+            batch = list(accumulate(range(self.i + 1, self.i + n), operator.mul, initial=self._fact))
+            self.i += n
+            self._fact = batch[-1] * self.i
+            return batch
+
+fact_iter = iter(Factorials())
+fact_iter.advance(5)
+next(fact_iter) #120
+fact_iter.seek(10)
+next(fact_iter) #3628800
+fact_iter.seek(3)
+fact_iter.next_batch(3) #[6, 24, 120]
+
+def skip_by_next(it, k):
+    for _ in range(k):
+        next(it)
+
+timeit('skip_by_next(iter(Factorials()), 20_000)', globals=globals(), number=1) #0.0832 secs
+timeit('iter(Factorials()).advance(20_000)', globals=globals(), number=1) #0.0091 secs
+
+# =============================================================================
+# Checkpointing Factorials
+# To save a FactIter's progress and resume it later (see the CheckpointManager in the
+# Sorting Iterables lecture) we need getstate() / setstate().
+# 
+# The only real state is i - we don't save the current factorial itself, since
+# after a long run it has millions of digits and the checkpoint would keep growing.
+# setstate just seeks back to i, and seek rebuilds i! with math.factorial.
+# =============================================================================
+
+class Factorials:
+    def __init__(self, length=None):
+        self.length = length
+    
+    def __iter__(self):
+        return self.FactIter(self.length)
+    
+    class FactIter:
+        def __init__(self, length=None):
+            self.length = length
+            self.i = 0
+            self._fact = 1   # always i!
+        
+        def __iter__(self):
+            return self
+        
+        def __next__(self):
+            if self.length is not None and self.i >= self.length:
+                raise StopIteration
+            else:
+                result = self._fact
+                self.i += 1
+                self._fact *= self.i
+                return result
+        
+        def seek(self, k):
+            k = max(k, 0)
+            if self.length is not None:
+                k = min(k, self.length)
+            if self.i <= k <= self.i + 64:
+                # a short hop forward - just multiply our way there
+                self._fact *= math.prod(range(self.i + 1, k + 1))
+            else:
+                self._fact = math.factorial(k)
+            self.i = k
+        
+        def advance(self, k):
+            self.seek(self.i + k)
+        
+        def next_batch(self, n):
+            n = max(n, 0)
+            if self.length is not None:
+                n = max(min(n, self.length - self.i), 0)
+            if n == 0:
+                return []
+            batch = list(accumulate(range(self.i + 1, self.i + n), operator.mul, initial=self._fact))
+            self.i += n
+            self._fact = batch[-1] * self.i
+            return batch
+        
+        def getstate(self):
+            # just the position - the factorial itself can be huge, and seek rebuilds it
+            return {'i': self.i}
+        
+        def setstate(self, state):
+            self.seek(state['i'])
+
+fact_iter = iter(Factorials())
+fact_iter.next_batch(1000)
+state = fact_iter.getstate()
+state #{'i': 1000}
+
+resumed = iter(Factorials())
+resumed.setstate(state)
+next(resumed) == next(fact_iter) == math.factorial(1000) #True
+
+# =============================================================================
+# Paged posts, fetched ahead of time
+# Back to the forum posts example from the top: an iterable that goes back to the
+# database for the next page of 5 posts every time we run out. The problem is that
+# while a page is being fetched the consumer just sits there waiting, and while the
+# consumer is busy with a page nobody is fetching the next one.
+#
+# With asyncio we can overlap the two. Posts is an async iterable (__aiter__ / __anext__,
+# used with async for), and its iterator keeps the next `prefetch` pages already
+# requested (as tasks) while we work on the current one. By the time we need the next
+# page it's usually already there.
+#
+# - backpressure: we never request more than 1 + prefetch pages ahead of the consumer -
+#   if the consumer is slow, fetching simply stops until it takes the next page, so a
+#   slow consumer can't make us pile up pages in memory. in_flight / buffered tell you
+#   how many pages are being fetched / are waiting to be consumed.
+# - adaptive page size: if a target_latency is given, every fetch is timed - if a page
+#   came back in less than half the target, the next pages requested are twice as big,
+#   if it took longer than the target they're half as big. Small pages while the
+#   database is slow, big ones (fewer round trips) while it's fast.
+# - pages are requested by offset, so that several can be requested at once (with
+#   "WHERE id > last id" paging every page would have to wait for the previous one)
+# - a page that comes back short is the last one - any pages requested after it are
+#   cancelled
+#
+# The data source is anything with an async fetch(offset, size) method - here an
+# in-process fake that just sleeps, and a sqlite one that runs its queries in a thread
+# (asyncio.to_thread) so that they don't block the event loop.
+# =============================================================================
+
+import asyncio
+import os
+import sqlite3
+import tempfile
+import threading
+from collections import deque
+from time import perf_counter
+
+class FakePosts:
+    # pretends to be a database: every fetch takes latency + per_item * size seconds
+    def __init__(self, n, latency=0.02, per_item=0.0001):
+        self.n = n
+        self.latency = latency
+        self.per_item = per_item
+        self.fetches = 0
+
+    async def fetch(self, offset, size):
+        self.fetches += 1
+        await asyncio.sleep(self.latency + self.per_item * size)
+        return [{'id': i, 'title': f'Post {i}'} for i in range(offset, min(offset + size, self.n))]
+
+class SqlitePosts:
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()   # the connection is shared by the worker threads
+        self.fetches = 0
+
+    def _fetch(self, offset, size):
+        with self._lock:
+            rows = self._conn.execute('SELECT id, title FROM posts ORDER BY id LIMIT ? OFFSET ?',
+                                      (size, offset)).fetchall()
+        return [{'id': id_, 'title': title} for id_, title in rows]
+
+    async def fetch(self, offset, size):
+        self.fetches += 1
+        return await asyncio.to_thread(self._fetch, offset, size)
+
+    def close(self):
+        self._conn.close()
+
+class Posts:
+    def __init__(self, source, page_size=5, prefetch=2, target_latency=None, max_page_size=1000):
+        self.source = source
+        self.page_size = page_size
+        self.prefetch = prefetch
+        self.target_latency = target_latency
+        self.max_page_size = max_page_size
+
+    def __aiter__(self):
+        return self.PostsIterator(self.source, self.page_size, self.prefetch,
+                                  self.target_latency, self.max_page_size)
+
+    class PostsIterator:
+        def __init__(self, source, page_size, prefetch, target_latency, max_page_size):
+            self._source = source
+            self.page_size = page_size
+            self._prefetch = prefetch
+            self._target_latency = target_latency
+            self._max_page_size = max_page_size
+            self._pages = deque()   # (task, size) for the pages requested, in order
+            self._next_offset = 0
+            self._done = False      # seen the last page, don't request any more
+            self._current = iter(())
+
+        def __aiter__(self):
+            return self
+
+        async def __anext__(self):
+            while True:
+                for post in self._current:
+                    return post
+                self._current = iter(await self.next_page())
+
+        async def next_page(self):
+            rest = list(self._current)
+            if rest:
+                self._current = iter(())
+                return rest
+            self._request_pages()
+            if not self._pages:
+                raise StopAsyncIteration
+            task, size = self._pages.popleft()
+            page = await task
+            if len(page) < size:
+                self._done = True
+                self._cancel()
+            if not page:
+                raise StopAsyncIteration
+            return page
+
+        def _request_pages(self):
+            # this is the backpressure: at most 1 + prefetch pages ahead of the consumer
+            while not self._done and len(self._pages) < 1 + self._prefetch:
+                size = self.page_size
+                task = asyncio.create_task(self._fetch(self._next_offset, size))
+                self._pages.append((task, size))
+                self._next_offset += size
+
+        async def _fetch(self, offset, size):
+            start = perf_counter()
+            page = await self._source.fetch(offset, size)
+            self._adapt(perf_counter() - start)
+            return page
+
+        def _adapt(self, elapsed):
+            if self._target_latency is None:
+                return
+            if elapsed < self._target_latency / 2:
+                self.page_size = min(self.page_size * 2, self._max_page_size)
+            elif elapsed > self._target_latency:
+                self.page_size = max(self.page_size // 2, 1)
+
+        def _cancel(self):
+            for task, _ in self._pages:
+                task.cancel()
+            self._pages.clear()
+
+        @property
+        def in_flight(self):
+            return sum(not task.done() for task, _ in self._pages)
+
+        @property
+        def buffered(self):
+            return sum(task.done() for task, _ in self._pages)
+
+        async def aclose(self):
+            # stop early - don't leave fetches running in the background
+            self._done = True
+            self._cancel()
+
+async def collect(posts):
+    return [post['id'] async for post in posts]
+
+async def first_pages():
+    post_iter = aiter(Posts(FakePosts(12), page_size=5, prefetch=2))
+    page = await post_iter.next_page()
+    result = [post['id'] for post in page], post_iter.in_flight, post_iter.buffered
+    await post_iter.aclose()
+    return result
+
+asyncio.run(collect(Posts(FakePosts(12), page_size=5))) #[0, 1, 2, ..., 11]
+asyncio.run(first_pages()) #([0, 1, 2, 3, 4], 0, 2) - the next 2 pages were fetched alongside the first
+
+# a consumer that takes 20ms to deal with each page, a database that takes ~20ms per page
+async def consume(posts, work=0.02):
+    post_iter = aiter(posts)
+    count = 0
+    start = perf_counter()
+    try:
+        while True:
+            count += len(await post_iter.next_page())
+            await asyncio.sleep(work)
+    except StopAsyncIteration:
+        return count, post_iter.page_size, perf_counter() - start
+
+source = FakePosts(500)
+asyncio.run(consume(Posts(source, page_size=5, prefetch=0))), source.fetches #((500, 5, 4.20), 101) - (posts, final page size, secs), fetches
+source = FakePosts(500)
+asyncio.run(consume(Posts(source, page_size=5, prefetch=2))), source.fetches #((500, 5, 2.07), 102) - fetching overlaps the work
+source = FakePosts(500)
+asyncio.run(consume(Posts(source, page_size=5, prefetch=2, target_latency=0.05))), source.fetches #((500, 160, 0.21), 10) - pages grew to 160 posts
+
+# a slow consumer doesn't make pages pile up
+async def slow_consumer():
+    post_iter = aiter(Posts(FakePosts(1000), page_size=10, prefetch=3))
+    await post_iter.next_page()
+    await asyncio.sleep(0.5)   # busy for a long time - all the prefetched pages are in
+    buffered = post_iter.buffered
+    await post_iter.aclose()
+    return buffered, post_iter.in_flight
+
+asyncio.run(slow_consumer()) #(3, 0)
+
+# the same thing against sqlite
+directory = tempfile.mkdtemp()
+path = os.path.join(directory, 'posts.db')
+with sqlite3.connect(path) as conn:
+    conn.execute('CREATE TABLE posts (id INTEGER PRIMARY KEY, title TEXT)')
+    conn.executemany('INSERT INTO posts VALUES (?, ?)', ((i, f'Post {i}') for i in range(1, 10_001)))
+conn.close()
+
+source = SqlitePosts(path)
+asyncio.run(collect(Posts(source, page_size=100, prefetch=3, target_latency=0.01))) == list(range(1, 10_001)) #True
+source.fetches #17 - with a fixed page size of 100 it would be 101
+source.close()
+os.remove(path)
+os.rmdir(directory)
+
+# =============================================================================
+# Batching the Actor lookups
+# The Actor class from the top loads its movies lazily - one query the first time
+# actor.movies is used. For one actor that's great, but for a list of 10,000 actors:
+#     for actor in actors:
+#         print(actor.movies)
+# that's 10,000 separate queries (plus another 10,000 for the bios, which are loaded
+# eagerly in __init__) - the classic "N+1 queries" problem.
+#
+# Instead, every Actor registers itself with an ActorLoader when it's created, and
+# stays lazy. The first time any actor needs its movies, the loader fetches the movies
+# for *every* actor that's waiting for them (everything registered since the last
+# query - that's our batch window) with one
+#     SELECT ... WHERE actor_id IN (?, ?, ...)
+# and stores the results in each of those actors' caches. Same thing for the bios.
+# Ids are deduplicated before they go into the query, and a batch is split into
+# chunks of max_batch ids (sqlite limits the number of ? parameters in one statement).
+#
+# The loader only holds weak references to the actors waiting for a field - an actor
+# whose movies are never asked for would otherwise stay in the movies batch (and in
+# memory) forever. Once nobody else uses an actor it simply drops out of the batch.
+# =============================================================================
+
+import weakref
+
+class ActorLoader:
+    def __init__(self, conn, max_batch=999):
+        self._conn = conn
+        self._max_batch = max_batch
+        # field -> the actors waiting for it
+        self._pending = {'bio': weakref.WeakSet(), 'movies': weakref.WeakSet()}
+        self.queries = 0
+
+    def register(self, actor):
+        for waiting in self._pending.values():
+            waiting.add(actor)
+
+    def load(self, field, actor):
+        # actor needs field - load it for everyone (still alive) waiting for it
+        waiting = self._pending[field]
+        self._pending[field] = weakref.WeakSet()
+        by_id = {actor.actor_id: [actor]}
+        for waiting_actor in waiting:
+            if waiting_actor is not actor:
+                by_id.setdefault(waiting_actor.actor_id, []).append(waiting_actor)
+        ids = list(by_id)   # dict keys, so already deduplicated
+        for i in range(0, len(ids), self._max_batch):
+            chunk = ids[i:i + self._max_batch]
+            results = getattr(self, f'_query_{field}')(chunk)
+            for actor_id in chunk:
+                for waiting_actor in by_id[actor_id]:
+                    waiting_actor._cache[field] = results.get(actor_id)
+
+    def _query_bio(self, ids):
+        self.queries += 1
+        rows = self._conn.execute(
+            f'SELECT actor_id, bio FROM actors WHERE actor_id IN ({",".join("?" * len(ids))})', ids)
+        return dict(rows)
+
+    def _query_movies(self, ids):
+        self.queries += 1
+        rows = self._conn.execute(
+            f'SELECT actor_id, title FROM movies WHERE actor_id IN ({",".join("?" * len(ids))}) '
+            'ORDER BY actor_id, year', ids)
+        movies = {actor_id: [] for actor_id in ids}
+        for actor_id, title in rows:
+            movies[actor_id].append(title)
+        return movies
+
+class Actor:
+    def __init__(self, actor_id, loader):
+        self.actor_id = actor_id
+        self._loader = loader
+        self._cache = {}
+        loader.register(self)
+
+    @property
+    def bio(self):
+        if 'bio' not in self._cache:
+            self._loader.load('bio', self)
+        return self._cache['bio']
+
+    @property
+    def movies(self):
+        if 'movies' not in self._cache:
+            self._loader.load('movies', self)
+        return self._cache['movies']
+
+# and the one query per actor version, for comparison
+def lookup_actor_in_db(conn, actor_id):
+    row = conn.execute('SELECT bio FROM actors WHERE actor_id = ?', (actor_id,)).fetchone()
+    return row[0] if row else None
+
+def lookup_movies_in_db(conn, actor_id):
+    rows = conn.execute('SELECT title FROM movies WHERE actor_id = ? ORDER BY year', (actor_id,))
+    return [title for title, in rows]
+
+class OneByOneActor:
+    def __init__(self, conn, actor_id):
+        self._conn = conn
+        self.actor_id = actor_id
+        self.bio = lookup_actor_in_db(conn, actor_id)
+        self._movies = None
+
+    @property
+    def movies(self):
+        if self._movies is None:
+            self._movies = lookup_movies_in_db(self._conn, self.actor_id)
+        return self._movies
+
+conn = sqlite3.connect(':memory:')
+conn.execute('CREATE TABLE actors (actor_id INTEGER PRIMARY KEY, name TEXT, bio TEXT)')
+conn.execute('CREATE TABLE movies (actor_id INTEGER, title TEXT, year INTEGER)')
+conn.execute('CREATE INDEX movies_actor ON movies (actor_id)')
+conn.executemany('INSERT INTO actors VALUES (?, ?, ?)',
+                 ((i, f'Actor {i}', f'Actor {i} was born in {1900 + i % 100}.') for i in range(10_000)))
+conn.executemany('INSERT INTO movies VALUES (?, ?, ?)',
+                 ((i, f'Movie {i}-{j}', 1950 + j) for i in range(10_000) for j in range(5)))
+
+# count every statement sqlite runs
+statements = 0
+def count_statement(sql):
+    global statements
+    statements += 1
+conn.set_trace_callback(count_statement)
+
+loader = ActorLoader(conn)
+actors = [Actor(actor_id, loader) for actor_id in [1, 2, 3, 2, 42_000]]
+statements #0 - nothing loaded yet
+actors[0].movies #['Movie 1-0', 'Movie 1-1', 'Movie 1-2', 'Movie 1-3', 'Movie 1-4']
+statements #1 - and that loaded the movies of all 5 actors (4 different ids)
+actors[3].movies, actors[4].movies #(['Movie 2-0', ...], [])
+actors[4].bio, statements #(None, 2)
+
+# actors that are gone don't stay in the batch
+actor = Actor(7, loader)
+actor.movies #['Movie 7-0', 'Movie 7-1', 'Movie 7-2', 'Movie 7-3', 'Movie 7-4']
+actor_ref = weakref.ref(actor)
+del actor
+actor_ref() #None - even though its bio was never loaded
+len(loader._pending['bio']) #0
+
+def all_movies(actors):
+    return sum(len(actor.movies) + len(actor.bio or '') for actor in actors)
+
+statements = 0
+loader = ActorLoader(conn)
+all_movies([Actor(actor_id, loader) for actor_id in range(10_000)]) #328890
+statements, loader.queries #(22, 22) - 11 chunks of 999 ids, for bio and for movies
+statements = 0
+all_movies([OneByOneActor(conn, actor_id) for actor_id in range(10_000)]) #328890
+statements #20000
+
+conn.set_trace_callback(None)
+timeit('loader = ActorLoader(conn); all_movies([Actor(actor_id, loader) for actor_id in range(10_000)])',
+       globals=globals(), number=1) #0.085 secs
+timeit('all_movies([OneByOneActor(conn, actor_id) for actor_id in range(10_000)])',
+       globals=globals(), number=1) #0.088 secs
+# (an in-memory sqlite query costs microseconds, so here the difference is small - with a
+# database server every query is a network round trip, and it's 22 round trips vs 20,000)
+
+# =============================================================================
+# One Actor per actor_id
+# If different parts of a program each do Actor(42), every one of them gets its own
+# instance - each one runs lookup_actor_in_db in __init__, and each one keeps its own
+# movies cache (so the movies get loaded again for every copy too).
+#
+# An identity map fixes that: a dictionary actor_id -> the Actor instance for it.
+# Actor(42) first looks in the map, and only creates (and loads) a new instance if there
+# isn't one yet. To do that, the lookup happens in __new__ - __new__ can return an
+# existing object instead of a new one. (That's also why this Actor has no __init__:
+# Python would call it again on the instance __new__ returns, even an old one.)
+#
+# The map holds the instances through weak references (weakref.WeakValueDictionary),
+# so it doesn't keep them alive - once nobody uses Actor(42) anymore it is garbage
+# collected and drops out of the map, and the next Actor(42) loads it fresh.
+#
+# If two threads ask for the same (not yet loaded) id at the same time, only one of them
+# should run the query - the other should wait for it and get the same instance
+# ("single flight"). The first thread puts a Future for the id in _in_flight, anyone
+# else asking for that id meanwhile just waits on the Future's result. If the load
+# fails, they all get the exception, and the next call tries again.
+#
+# hits (found in the map) + waits (got the result of someone else's load) is the
+# number of lookups we didn't have to run. A thread that waited for a load that failed
+# doesn't count - it got an exception, not an actor.
+# =============================================================================
+
+import time
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor
+
+class IdentityMap:
+    def __init__(self, load):
+        self._load = load
+        self._live = weakref.WeakValueDictionary()
+        self._in_flight = {}   # key -> Future, while it's being loaded
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.hits = 0
+        self.waits = 0
+
+    def get(self, key):
+        with self._lock:
+            obj = self._live.get(key)
+            if obj is not None:
+                self.hits += 1
+                return obj
+            future = self._in_flight.get(key)
+            first = future is None
+            if first:
+                future = self._in_flight[key] = Future()
+        if not first:
+            # somebody else is loading it already - wait for their result
+            obj = future.result()
+            with self._lock:
+                self.waits += 1   # only counts if the load worked
+            return obj
+        try:
+            obj = self._load(key)
+        except BaseException as ex:
+            with self._lock:
+                del self._in_flight[key]
+            future.set_exception(ex)
+            raise
+        with self._lock:
+            self._live[key] = obj
+            del self._in_flight[key]
+            self.loads += 1
+        future.set_result(obj)
+        return obj
+
+    @property
+    def saved(self):
+        return self.hits + self.waits
+
+    def __len__(self):
+        return len(self._live)
+
+class Actor:
+    conn = None
+
+    def __new__(cls, actor_id):
+        return cls._identity_map.get(actor_id)
+
+    @classmethod
+    def _load(cls, actor_id):
+        actor = super().__new__(cls)
+        actor.actor_id = actor_id
+        actor.bio = lookup_actor_in_db(cls.conn, actor_id)
+        actor._movies = None
+        return actor
+
+    @property
+    def movies(self):
+        if self._movies is None:
+            self._movies = lookup_movies_in_db(self.conn, self.actor_id)
+        return self._movies
+
+Actor._identity_map = IdentityMap(Actor._load)
+
+# a copy of the actors database from above that threads can share
+conn.commit()   # (backup waits for the open transaction from the inserts otherwise)
+Actor.conn = sqlite3.connect(':memory:', check_same_thread=False)
+conn.backup(Actor.conn)
+
+a = Actor(42)
+b = Actor(42)
+a is b #True
+a.bio #'Actor 42 was born in 1942.'
+Actor._identity_map.loads, Actor._identity_map.saved #(1, 1)
+len(Actor._identity_map) #1
+del a, b
+len(Actor._identity_map) #0 - nobody was using it anymore, so it's gone
+Actor(42) is not None, Actor._identity_map.loads #(True, 2) - so it had to be loaded again
+
+# single flight: 16 threads, 8 for each of two actors, all asking at once, with a slow database
+def slow_load(actor_id):
+    time.sleep(0.1)
+    return Actor._load(actor_id)
+
+Actor._identity_map = IdentityMap(slow_load)
+with ThreadPoolExecutor(16) as executor:
+    actors = list(executor.map(Actor, [7] * 8 + [8] * 8))
+len({id(actor) for actor in actors}) #2
+Actor._identity_map.loads, Actor._identity_map.waits, Actor._identity_map.saved #(2, 14, 14)
+actors[0].movies is actors[7].movies #True - one movies cache too
+
+# if the load fails, the threads waiting for it get the exception - and weren't saved anything
+def failing_load(actor_id):
+    time.sleep(0.1)
+    raise LookupError(actor_id)
+
+Actor._identity_map = IdentityMap(failing_load)
+with ThreadPoolExecutor(4) as executor:
+    futures = [executor.submit(Actor, 9) for _ in range(4)]
+[type(future.exception()).__name__ for future in futures] #['LookupError', 'LookupError', 'LookupError', 'LookupError']
+Actor._identity_map.waits, Actor._identity_map.saved #(0, 0)
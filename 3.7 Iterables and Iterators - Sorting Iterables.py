@@ -26,7 +26,7 @@ for i in range(10):
 9
 '''
 import random
-​
+
 class RandomInts:
     def __init__(self, length, *, seed=0, lower=0, upper=10):
         self.length = length
@@ -82,3 +82,452 @@ sorted(randoms)
 #[0, 4, 4, 5, 6, 6, 6, 7, 7, 8]
 sorted(randoms, reverse=True)
 #[8, 7, 7, 6, 6, 6, 5, 4, 4, 0]
+
+# =============================================================================
+# Random numbers in batches
+# Same idea as for Squares and Factorials: a next_batch(n) method on the iterator
+# that returns up to n random integers at once. We still call random.randint for every
+# number (so we get exactly the same numbers as calling next() would, for the same
+# seed), but inside a list comprehension, with the lookups done once per batch
+# instead of once per number.
+# =============================================================================
+
+from timeit import timeit
+
+class RandomInts:
+    def __init__(self, length, *, seed=0, lower=0, upper=10):
+        self.length = length
+        self.seed = seed
+        self.lower = lower
+        self.upper = upper
+        
+    def __len__(self):
+        return self.length
+    
+    def __iter__(self):
+        return self.RandomIterator(self.length, 
+                                   seed = self.seed, 
+                                   lower = self.lower,
+                                   upper=self.upper)
+    
+    
+    class RandomIterator:
+        def __init__(self, length, *, seed, lower, upper):
+            self.length = length
+            self.lower = lower
+            self.upper = upper
+            self.num_requests = 0
+            random.seed(seed)
+            
+        def __iter__(self):
+            return self
+        
+        def __next__(self):
+            if self.num_requests >= self.length:
+                raise StopIteration
+            else:
+                result = random.randint(self.lower, self.upper)
+                self.num_requests += 1
+                return result
+        
+        def next_batch(self, n):
+            n = max(min(n, self.length - self.num_requests), 0)
+            randint, lower, upper = random.randint, self.lower, self.upper
+            batch = [randint(lower, upper) for _ in range(n)]
+            self.num_requests += n
+            return batch
+
+randoms = RandomInts(10)
+random_iter = iter(randoms)
+random_iter.next_batch(4) #[6, 6, 0, 4]
+next(random_iter) #8
+random_iter.next_batch(100) #[7, 6, 4, 7, 5]   - the same 10 numbers as before
+random_iter.next_batch(100) #[]
+
+def batched_loop(it, n):
+    while it.next_batch(n):
+        pass
+
+randoms = RandomInts(100_000)
+timeit('for _ in randoms: pass', globals=globals(), number=10) #0.4077 secs
+timeit('batched_loop(iter(randoms), 1024)', globals=globals(), number=10) #0.2998 secs   (most of what's left is random.randint itself)
+
+# =============================================================================
+# Skipping ahead in random sequences
+# We'd like RandomInts iterators to support the same seek/advance protocol as the
+# Squares iterator (Iterators lecture). But the random module's generator (the
+# Mersenne Twister) has a big internal state that can only move forward one draw at a
+# time - randint even uses a variable number of draws per number. So the best
+# RandomIterator can do is to replay the draws, using next_batch so at least they run
+# in a comprehension. That's still O(k).
+# 
+# If we want real O(1) skipping, we need a generator whose n-th number can be
+# computed directly from the seed and n - a counter based generator. SplitMix64 is
+# the classic simple one: take seed + (n+1) * 0x9E3779B97F4A7C15, and scramble the bits
+# with a couple of xor-shifts and multiplications (all modulo 2**64).
+# To map the 64 bit result x onto [lower, upper] we use (x * width) >> 64 rather than
+# x % width, which is cheaper and spreads the numbers just as evenly.
+# 
+# CounterRandomInts gives different numbers than RandomInts for the same seed, of
+# course - but the iterator's whole state is a single counter, and since any element
+# can be computed on its own, it's a sequence too.
+# =============================================================================
+
+class RandomInts:
+    def __init__(self, length, *, seed=0, lower=0, upper=10):
+        self.length = length
+        self.seed = seed
+        self.lower = lower
+        self.upper = upper
+        
+    def __len__(self):
+        return self.length
+    
+    def __iter__(self):
+        return self.RandomIterator(self.length, 
+                                   seed = self.seed, 
+                                   lower = self.lower,
+                                   upper=self.upper)
+    
+    
+    class RandomIterator:
+        def __init__(self, length, *, seed, lower, upper):
+            self.length = length
+            self.lower = lower
+            self.upper = upper
+            self.num_requests = 0
+            self.seed = seed
+            random.seed(seed)
+            
+        def __iter__(self):
+            return self
+        
+        def __next__(self):
+            if self.num_requests >= self.length:
+                raise StopIteration
+            else:
+                result = random.randint(self.lower, self.upper)
+                self.num_requests += 1
+                return result
+        
+        def seek(self, k):
+            # the Mersenne Twister can't jump - going back means starting over from the
+            # seed, and going forward means drawing (and dropping) the numbers in between
+            k = max(min(k, self.length), 0)
+            if k < self.num_requests:
+                random.seed(self.seed)
+                self.num_requests = 0
+            self.next_batch(k - self.num_requests)
+        
+        def advance(self, k):
+            self.seek(self.num_requests + k)
+        
+        def next_batch(self, n):
+            n = max(min(n, self.length - self.num_requests), 0)
+            randint, lower, upper = random.randint, self.lower, self.upper
+            batch = [randint(lower, upper) for _ in range(n)]
+            self.num_requests += n
+            return batch
+
+class CounterRandomInts:
+    _GAMMA = 0x9E3779B97F4A7C15
+    _MASK = 2**64 - 1
+    
+    def __init__(self, length, *, seed=0, lower=0, upper=10):
+        self.length = length
+        self.seed = seed
+        self.lower = lower
+        self.upper = upper
+    
+    def __len__(self):
+        return self.length
+    
+    def _value(self, n):
+        z = (self.seed + (n + 1) * self._GAMMA) & self._MASK
+        z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & self._MASK
+        z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & self._MASK
+        z ^= z >> 31
+        return self.lower + ((z * (self.upper - self.lower + 1)) >> 64)
+    
+    def __getitem__(self, s):
+        if isinstance(s, slice):
+            return [self._value(n) for n in range(self.length)[s]]
+        if s < 0:
+            s += self.length
+        if s < 0 or s >= self.length:
+            raise IndexError('CounterRandomInts index out of range')
+        return self._value(s)
+    
+    def __iter__(self):
+        return self.CounterIterator(self)
+    
+    class CounterIterator:
+        def __init__(self, randoms):
+            self._randoms = randoms
+            self.num_requests = 0
+        
+        def __iter__(self):
+            return self
+        
+        def __next__(self):
+            if self.num_requests >= self._randoms.length:
+                raise StopIteration
+            else:
+                result = self._randoms._value(self.num_requests)
+                self.num_requests += 1
+                return result
+        
+        def next_batch(self, n):
+            stop = min(self.num_requests + n, self._randoms.length)
+            batch = [self._randoms._value(k) for k in range(self.num_requests, stop)]
+            self.num_requests = max(stop, self.num_requests)
+            return batch
+        
+        def seek(self, k):
+            self.num_requests = max(min(k, self._randoms.length), 0)
+        
+        def advance(self, k):
+            self.seek(self.num_requests + k)
+
+random_iter = iter(RandomInts(10))
+random_iter.advance(4)
+next(random_iter) #8   - same as the 5th number before
+random_iter.seek(0)
+random_iter.next_batch(3) #[6, 6, 0]
+
+counter_randoms = CounterRandomInts(10**12, seed=42)
+counter_iter = iter(counter_randoms)
+counter_iter.next_batch(5) #[8, 1, 3, 3, 0]
+counter_iter.advance(10**11)
+next(counter_iter) == counter_randoms[10**11 + 5] #True
+sorted(CounterRandomInts(10, seed=42)) #[0, 1, 2, 3, 3, 3, 6, 8, 8, 9]
+
+timeit('iter(RandomInts(10**6)).advance(10**6 - 1)', globals=globals(), number=1) #0.7324 secs
+timeit('iter(CounterRandomInts(10**6)).advance(10**6 - 1)', globals=globals(), number=1) #0.00001 secs
+
+# =============================================================================
+# Checkpointing iterators
+# If a job that has been pulling numbers out of a RandomIterator for hours crashes,
+# we have to start over - the position (num_requests) and, more importantly, the state
+# of the random number generator are gone.
+# 
+# So every iterator gets two methods:
+# getstate()       - returns a small dict with everything needed to continue from here
+# setstate(state)  - puts a (freshly created) iterator back into that state
+# 
+# For RandomIterator that's num_requests plus random.getstate() - a fixed size tuple
+# of 625 numbers, however far into the sequence we are. For the counter based
+# iterator, num_requests alone is enough.
+# 
+# A CheckpointManager then looks after the iterators of a pipeline by name:
+# restore()  - if there is a checkpoint file, setstate every iterator from it
+# tick()     - call once per processed item; every `every` items it saves the state
+#              of all the iterators (pickle to a temp file, then os.replace, so a crash
+#              while saving never leaves a half written checkpoint behind)
+# clear()    - remove the checkpoint once the job is done
+# 
+# Saving only looks at getstate(), so each checkpoint costs the same no matter how long
+# the job has been running. After a crash we lose at most the `every` items processed
+# since the last checkpoint - those get produced again.
+# =============================================================================
+
+import os
+import pickle
+import tempfile
+
+class RandomInts:
+    def __init__(self, length, *, seed=0, lower=0, upper=10):
+        self.length = length
+        self.seed = seed
+        self.lower = lower
+        self.upper = upper
+        
+    def __len__(self):
+        return self.length
+    
+    def __iter__(self):
+        return self.RandomIterator(self.length, 
+                                   seed = self.seed, 
+                                   lower = self.lower,
+                                   upper=self.upper)
+    
+    
+    class RandomIterator:
+        def __init__(self, length, *, seed, lower, upper):
+            self.length = length
+            self.lower = lower
+            self.upper = upper
+            self.num_requests = 0
+            self.seed = seed
+            random.seed(seed)
+            
+        def __iter__(self):
+            return self
+        
+        def __next__(self):
+            if self.num_requests >= self.length:
+                raise StopIteration
+            else:
+                result = random.randint(self.lower, self.upper)
+                self.num_requests += 1
+                return result
+        
+        def seek(self, k):
+            # the Mersenne Twister can't jump - going back means starting over from the
+            # seed, and going forward means drawing (and dropping) the numbers in between
+            k = max(min(k, self.length), 0)
+            if k < self.num_requests:
+                random.seed(self.seed)
+                self.num_requests = 0
+            self.next_batch(k - self.num_requests)
+        
+        def advance(self, k):
+            self.seek(self.num_requests + k)
+        
+        def getstate(self):
+            return {'num_requests': self.num_requests, 'random': random.getstate()}
+        
+        def setstate(self, state):
+            self.num_requests = state['num_requests']
+            random.setstate(state['random'])
+        
+        def next_batch(self, n):
+            n = max(min(n, self.length - self.num_requests), 0)
+            randint, lower, upper = random.randint, self.lower, self.upper
+            batch = [randint(lower, upper) for _ in range(n)]
+            self.num_requests += n
+            return batch
+
+class CounterRandomInts:
+    _GAMMA = 0x9E3779B97F4A7C15
+    _MASK = 2**64 - 1
+    
+    def __init__(self, length, *, seed=0, lower=0, upper=10):
+        self.length = length
+        self.seed = seed
+        self.lower = lower
+        self.upper = upper
+    
+    def __len__(self):
+        return self.length
+    
+    def _value(self, n):
+        z = (self.seed + (n + 1) * self._GAMMA) & self._MASK
+        z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & self._MASK
+        z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & self._MASK
+        z ^= z >> 31
+        return self.lower + ((z * (self.upper - self.lower + 1)) >> 64)
+    
+    def __getitem__(self, s):
+        if isinstance(s, slice):
+            return [self._value(n) for n in range(self.length)[s]]
+        if s < 0:
+            s += self.length
+        if s < 0 or s >= self.length:
+            raise IndexError('CounterRandomInts index out of range')
+        return self._value(s)
+    
+    def __iter__(self):
+        return self.CounterIterator(self)
+    
+    class CounterIterator:
+        def __init__(self, randoms):
+            self._randoms = randoms
+            self.num_requests = 0
+        
+        def __iter__(self):
+            return self
+        
+        def __next__(self):
+            if self.num_requests >= self._randoms.length:
+                raise StopIteration
+            else:
+                result = self._randoms._value(self.num_requests)
+                self.num_requests += 1
+                return result
+        
+        def next_batch(self, n):
+            stop = min(self.num_requests + n, self._randoms.length)
+            batch = [self._randoms._value(k) for k in range(self.num_requests, stop)]
+            self.num_requests = max(stop, self.num_requests)
+            return batch
+        
+        def seek(self, k):
+            self.num_requests = max(min(k, self._randoms.length), 0)
+        
+        def advance(self, k):
+            self.seek(self.num_requests + k)
+        
+        def getstate(self):
+            return {'num_requests': self.num_requests}
+        
+        def setstate(self, state):
+            self.num_requests = state['num_requests']
+
+class CheckpointManager:
+    def __init__(self, path, iterators, every=1000):
+        self.path = path
+        self.iterators = iterators   # {name: iterator}
+        self.every = every
+        self._count = 0
+    
+    def restore(self):
+        try:
+            with open(self.path, 'rb') as f:
+                states = pickle.load(f)
+        except FileNotFoundError:
+            return False
+        for name, state in states.items():
+            self.iterators[name].setstate(state)
+        return True
+    
+    def save(self):
+        states = {name: it.getstate() for name, it in self.iterators.items()}
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(states, f)
+        os.replace(tmp_path, self.path)
+    
+    def tick(self):
+        self._count += 1
+        if self._count % self.every == 0:
+            self.save()
+    
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+#Let's run a pipeline that pairs up numbers from both kinds of iterators - and crash it
+#half way through:
+
+checkpoint_path = os.path.join(tempfile.mkdtemp(), 'pipeline.ckpt')
+
+def run_pipeline(crash_after=None):
+    randoms, counters = iter(RandomInts(10_000, seed=1)), iter(CounterRandomInts(10_000, seed=1))
+    checkpoints = CheckpointManager(checkpoint_path, {'randoms': randoms, 'counters': counters}, every=1000)
+    resumed = checkpoints.restore()
+    results = []
+    for a, b in zip(randoms, counters):
+        if len(results) == crash_after:
+            raise RuntimeError('crash!')
+        results.append(a * b)
+        checkpoints.tick()
+    checkpoints.clear()
+    return resumed, results
+
+_, expected = run_pipeline()
+run_pipeline(crash_after=4321) #RuntimeError: crash!    (last checkpoint was at 4000 items)
+resumed, rest = run_pipeline()
+resumed, len(rest) #(True, 6000)
+rest == expected[4000:] #True   - picked up exactly where the checkpoint left off
+
+#Each checkpoint costs the same no matter how far in we are:
+
+it = iter(RandomInts(10**6))
+checkpoints = CheckpointManager(checkpoint_path, {'randoms': it})
+timeit('checkpoints.save()', globals=globals(), number=1000) #0.1464 secs
+it.advance(900_000)
+timeit('checkpoints.save()', globals=globals(), number=1000) #0.1442 secs   (~0.15 ms per checkpoint either way)
+checkpoints.clear()